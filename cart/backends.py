@@ -0,0 +1,417 @@
+import hashlib
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils.module_loading import import_string
+from payment.reservations import available_stock, held_units
+from store.models import Product, CartItem
+
+# Cache backend keys: one dict of lines per user, plus a log of users with unflushed changes
+LINES_KEY = 'cart:lines:{}'
+DIRTY_FLAG_KEY = 'cart:dirty:user:{}'
+DIRTY_LOG_KEY = 'cart:dirty:log:{}'
+DIRTY_SEQUENCE_KEY = 'cart:dirty:sequence'
+DIRTY_FLUSHED_KEY = 'cart:dirty:flushed'
+FLUSH_LOCK_KEY = 'cart:dirty:lock'
+
+FLUSH_BATCH_SIZE = getattr(settings, 'CART_FLUSH_BATCH_SIZE', 500)
+
+# Signed cookie guest cart
+COOKIE_NAME = getattr(settings, 'CART_COOKIE_NAME', 'cart')
+COOKIE_MAX_AGE = getattr(settings, 'CART_COOKIE_MAX_AGE', 60 * 60 * 24 * 30)
+# About 15 bytes a line keeps the cookie far below the 4 KB browser limit
+COOKIE_MAX_LINES = getattr(settings, 'CART_COOKIE_MAX_LINES', 50)
+COOKIE_SALT = 'cart.guest'
+PENDING_COOKIE_ATTR = '_guest_cart_cookie'
+
+
+class CartBackend:
+	"""
+	Where one visitor's cart lines live, as {product_id: quantity}.
+
+	Backends only keep quantities; Cart does pricing, totals and caching.
+	The generic add/update/remove/merge are built on quantities() and
+	set_quantities(), where a quantity of 0 removes the line.
+	"""
+	def __init__(self, request):
+		self.request = request
+
+	def owner_key(self):
+		"""Stable id for caches keyed per cart, None when the cart has no owner yet"""
+		return None
+
+	def quantities(self):
+		raise NotImplementedError
+
+	def set_quantities(self, quantities):
+		raise NotImplementedError
+
+	def clear(self):
+		raise NotImplementedError
+
+	def add(self, product, quantity):
+		"""Add to the line; False, with nothing written, if that would exceed the unheld stock"""
+		current = self.quantities().get(product.id, 0)
+		if current + quantity > available_stock(product):
+			return False
+		self.set_quantities({product.id: current + quantity})
+		return True
+
+	def update(self, product_id, quantity):
+		if product_id not in self.quantities():
+			return False
+		self.set_quantities({product_id: quantity})
+		return True
+
+	def remove(self, product_id):
+		return self.update(product_id, 0)
+
+	def merge(self, quantities):
+		"""Add quantities from another cart, such as a guest cart at login"""
+		current = self.quantities()
+		self.set_quantities({
+			product_id: current.get(product_id, 0) + quantity
+			for product_id, quantity in quantities.items()
+		})
+
+	def load_lines(self):
+		"""(product, quantity, cart_item_id) for every line, in one query"""
+		quantities = self.quantities()
+		if not quantities:
+			return []
+		products = Product.objects.filter(id__in=quantities).select_related('category', 'card')
+		return [(product, quantities[product.id], None) for product in products]
+
+	def flush(self):
+		"""Persist buffered writes; a no-op for backends that write through"""
+
+
+class SessionCartBackend(CartBackend):
+	"""Guest cart in request.session under 'session_key'"""
+	def __init__(self, request):
+		super().__init__(request)
+		self.session = request.session
+		# Read-only until the first write, so browsing never creates a session row
+		self.cart = self.session.get('session_key', {})
+
+	def owner_key(self):
+		if self.session.session_key:
+			return f'session:{self.session.session_key}'
+		return None
+
+	def quantities(self):
+		quantities = {}
+		for product_id, data in self.cart.items():
+			try:
+				quantities[int(product_id)] = int(data.get('quantity', 1))
+			except (TypeError, ValueError):
+				continue
+		return quantities
+
+	def set_quantities(self, quantities):
+		for product_id, quantity in quantities.items():
+			if quantity > 0:
+				self.cart.setdefault(str(product_id), {})['quantity'] = quantity
+			else:
+				self.cart.pop(str(product_id), None)
+		self._save()
+
+	def clear(self):
+		if 'session_key' in self.session:
+			self.cart.clear()
+			self._save()
+
+	def _save(self):
+		self.session['session_key'] = self.cart
+		self.session.modified = True
+
+
+class SignedCookieCartBackend(CartBackend):
+	"""
+	Guest cart in one signed cookie holding only "id-qty" pairs, so guests
+	cause no session rows and no database writes at all.
+
+	Opt in with CART_GUEST_BACKEND = 'cart.backends.SignedCookieCartBackend'
+	and add 'cart.middleware.GuestCartCookieMiddleware' to MIDDLEWARE; the
+	middleware writes the cookie the backend leaves on the request.
+	"""
+	def __init__(self, request):
+		super().__init__(request)
+		value = getattr(request, PENDING_COOKIE_ATTR, None)
+		if value is None:
+			value = request.COOKIES.get(COOKIE_NAME, '')
+		self._quantities = decode_cart_cookie(value)
+
+	def owner_key(self):
+		# Content-addressed: equal carts share a cached summary, and any change gets a new key
+		if not self._quantities:
+			return None
+		payload = _cookie_payload(self._quantities)
+		return f'cookie:{hashlib.sha256(payload.encode()).hexdigest()[:32]}'
+
+	def quantities(self):
+		return dict(self._quantities)
+
+	def add(self, product, quantity):
+		if product.id not in self._quantities and len(self._quantities) >= COOKIE_MAX_LINES:
+			return False
+		return super().add(product, quantity)
+
+	def set_quantities(self, quantities):
+		for product_id, quantity in quantities.items():
+			if quantity <= 0:
+				self._quantities.pop(product_id, None)
+			elif product_id in self._quantities or len(self._quantities) < COOKIE_MAX_LINES:
+				# New lines past the cap are dropped; the caller sees them missing from the snapshot
+				self._quantities[product_id] = quantity
+		setattr(self.request, PENDING_COOKIE_ATTR, encode_cart_cookie(self._quantities))
+
+	def clear(self):
+		self._quantities = {}
+		setattr(self.request, PENDING_COOKIE_ATTR, '')
+
+
+def _cookie_payload(quantities):
+	return '.'.join(f'{product_id}-{quantity}' for product_id, quantity in sorted(quantities.items()))
+
+
+def encode_cart_cookie(quantities):
+	if not quantities:
+		return ''
+	return signing.Signer(salt=COOKIE_SALT).sign(_cookie_payload(quantities))
+
+
+def decode_cart_cookie(value):
+	"""{product_id: quantity} from a cookie value; tampered or malformed cookies read as empty"""
+	if not value:
+		return {}
+	try:
+		payload = signing.Signer(salt=COOKIE_SALT).unsign(value)
+	except signing.BadSignature:
+		return {}
+	quantities = {}
+	for pair in payload.split('.')[:COOKIE_MAX_LINES]:
+		product_id, _, quantity = pair.partition('-')
+		try:
+			product_id, quantity = int(product_id), int(quantity)
+		except ValueError:
+			continue
+		if product_id > 0 and quantity > 0:
+			quantities[product_id] = quantity
+	return quantities
+
+
+class DatabaseCartBackend(CartBackend):
+	"""Signed-in cart in CartItem, written through on every change"""
+	def owner_key(self):
+		return f'user:{self.request.user.pk}'
+
+	def items(self):
+		return CartItem.objects.filter(user=self.request.user)
+
+	def quantities(self):
+		return dict(self.items().values_list('product_id', 'quantity'))
+
+	def set_quantities(self, quantities):
+		removed = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+		kept = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+		with transaction.atomic():
+			if removed:
+				self.items().filter(product_id__in=removed).delete()
+			if kept:
+				CartItem.objects.bulk_create(
+					[CartItem(user=self.request.user, product_id=product_id, quantity=quantity) for product_id, quantity in kept.items()],
+					update_conflicts=True,
+					unique_fields=['user', 'product'],
+					update_fields=['quantity'],
+				)
+
+	def add(self, product, quantity):
+		# One UPDATE ... SET quantity = quantity + n WHERE quantity + n <= stock - held,
+		# so concurrent adds never lose each other's increments
+		if self._increment(product.id, quantity):
+			return True
+		if quantity > available_stock(product):
+			return False
+		try:
+			with transaction.atomic():
+				CartItem.objects.create(user=self.request.user, product=product, quantity=quantity)
+			return True
+		except IntegrityError:
+			# The line exists (another request inserted it first, or it is at the stock limit)
+			return self._increment(product.id, quantity)
+
+	@staticmethod
+	def _stock_covers(quantity):
+		"""
+		WHERE EXISTS (product row with stock >= quantity + units held for pending
+		orders), correlated on the cart line. A join through product__stock would
+		make Django pre-select the ids on MySQL (no self-select in UPDATE) and
+		lose the atomic check.
+		"""
+		return Exists(Product.objects.filter(pk=OuterRef('product_id'), stock__gte=quantity + held_units()))
+
+	def _increment(self, product_id, quantity):
+		# Guard is quantity + n + held <= stock; never subtract from the unsigned stock column
+		return self.items().filter(
+			self._stock_covers(OuterRef('quantity') + quantity),
+			product_id=product_id,
+		).update(quantity=F('quantity') + quantity) > 0
+
+	def update(self, product_id, quantity):
+		return self.items().filter(
+			self._stock_covers(quantity),
+			product_id=product_id,
+		).update(quantity=quantity) > 0
+
+	def remove(self, product_id):
+		return self.items().filter(product_id=product_id).delete()[0] > 0
+
+	def clear(self):
+		self.items().delete()
+
+	def merge(self, quantities):
+		with transaction.atomic():
+			# Lines for products that no longer exist are dropped
+			product_ids = set(Product.objects.filter(id__in=quantities).values_list('id', flat=True))
+			existing = dict(
+				self.items().select_for_update()
+				.filter(product_id__in=product_ids)
+				.values_list('product_id', 'quantity')
+			)
+			self.set_quantities({
+				product_id: existing.get(product_id, 0) + quantities[product_id]
+				for product_id in product_ids
+			})
+
+	def load_lines(self):
+		items = self.items().select_related('product__category', 'product__card')
+		return [(item.product, item.quantity, item.id) for item in items]
+
+
+class CacheCartBackend(CartBackend):
+	"""
+	Signed-in cart kept in the cache and written behind to CartItem.
+
+	Every change marks the user dirty; flush_pending() (run periodically by
+	the flush_cart_writes command) and checkout write dirty carts back in
+	batches. The cache must not evict these keys before they are flushed,
+	so point it at a Redis instance without an eviction policy.
+	"""
+	def __init__(self, request):
+		super().__init__(request)
+		self.database = DatabaseCartBackend(request)
+		self.user_id = request.user.pk
+
+	def owner_key(self):
+		return f'user:{self.user_id}'
+
+	def quantities(self):
+		quantities = cache.get(LINES_KEY.format(self.user_id))
+		if quantities is None:
+			# Cold cart: the database copy is complete because nothing is pending
+			quantities = self.database.quantities()
+			cache.set(LINES_KEY.format(self.user_id), quantities, timeout=None)
+		return dict(quantities)
+
+	def set_quantities(self, quantities):
+		current = self.quantities()
+		for product_id, quantity in quantities.items():
+			if quantity > 0:
+				current[product_id] = quantity
+			else:
+				current.pop(product_id, None)
+		cache.set(LINES_KEY.format(self.user_id), current, timeout=None)
+		self._mark_dirty()
+
+	def clear(self):
+		cache.set(LINES_KEY.format(self.user_id), {}, timeout=None)
+		cache.delete(DIRTY_FLAG_KEY.format(self.user_id))
+		self.database.clear()
+
+	def flush(self):
+		write_cached_carts([self.user_id])
+
+	def _mark_dirty(self):
+		# Only the first change since the last flush goes into the log
+		if cache.add(DIRTY_FLAG_KEY.format(self.user_id), 1, timeout=None):
+			cache.add(DIRTY_SEQUENCE_KEY, 0, timeout=None)
+			sequence = cache.incr(DIRTY_SEQUENCE_KEY)
+			cache.set(DIRTY_LOG_KEY.format(sequence), self.user_id, timeout=None)
+
+	@staticmethod
+	def flush_pending(batch_size=FLUSH_BATCH_SIZE):
+		"""Write every dirty cart back to CartItem; returns the number of carts written"""
+		if not cache.add(FLUSH_LOCK_KEY, 1, timeout=300):
+			return 0
+		try:
+			flushed = cache.get(DIRTY_FLUSHED_KEY, 0)
+			last = cache.get(DIRTY_SEQUENCE_KEY, 0)
+			written = 0
+			for start in range(flushed + 1, last + 1, batch_size):
+				end = min(start + batch_size, last + 1)
+				log_keys = [DIRTY_LOG_KEY.format(sequence) for sequence in range(start, end)]
+				user_ids = set(cache.get_many(log_keys).values())
+				written += write_cached_carts(user_ids)
+				cache.delete_many(log_keys)
+				cache.set(DIRTY_FLUSHED_KEY, end - 1, timeout=None)
+			return written
+		finally:
+			cache.delete(FLUSH_LOCK_KEY)
+
+
+def write_cached_carts(user_ids):
+	"""Replace the CartItem rows of user_ids with their cached lines, in one transaction"""
+	carts = {}
+	for user_id in user_ids:
+		# Cleared first so a change made during the write marks the user again;
+		# a user already written at checkout has no flag left and is skipped
+		if not cache.delete(DIRTY_FLAG_KEY.format(user_id)):
+			continue
+		quantities = cache.get(LINES_KEY.format(user_id))
+		if quantities is not None:
+			carts[user_id] = quantities
+	if not carts:
+		return 0
+
+	all_ids = {product_id for quantities in carts.values() for product_id in quantities}
+	existing_ids = set(Product.objects.filter(id__in=all_ids).values_list('id', flat=True))
+	items = [
+		CartItem(user_id=user_id, product_id=product_id, quantity=quantity)
+		for user_id, quantities in carts.items()
+		for product_id, quantity in quantities.items()
+		if product_id in existing_ids
+	]
+	stale = reduce(or_, (
+		Q(user_id=user_id) & ~Q(product_id__in=list(quantities))
+		for user_id, quantities in carts.items()
+	))
+
+	with transaction.atomic():
+		CartItem.objects.filter(stale).delete()
+		if items:
+			CartItem.objects.bulk_create(
+				items,
+				batch_size=FLUSH_BATCH_SIZE,
+				update_conflicts=True,
+				unique_fields=['user', 'product'],
+				update_fields=['quantity'],
+			)
+	return len(carts)
+
+
+def get_guest_cart_backend(request):
+	backend_path = getattr(settings, 'CART_GUEST_BACKEND', 'cart.backends.SessionCartBackend')
+	return import_string(backend_path)(request)
+
+
+def get_cart_backend(request):
+	"""settings.CART_BACKEND for signed-in users, settings.CART_GUEST_BACKEND for guests"""
+	if request.user.is_authenticated:
+		backend_path = getattr(settings, 'CART_BACKEND', 'cart.backends.DatabaseCartBackend')
+		return import_string(backend_path)(request)
+	return get_guest_cart_backend(request)
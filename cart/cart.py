@@ -1,153 +1,198 @@
-from store.models import Product, CartItem
+from dataclasses import dataclass
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from store.catalog import get_catalog_version
+from store.models import Product, ProductCard
+from .backends import get_cart_backend, get_guest_cart_backend
+from .pricing import price_cart
+
+CART_SUMMARY_TIMEOUT = getattr(settings, 'CART_SUMMARY_TIMEOUT', 60 * 15)
+
+
+@dataclass(frozen=True)
+class CartSummary:
+	"""What the navbar shows: distinct items, total quantity and subtotal"""
+	item_count: int = 0
+	quantity: int = 0
+	subtotal: Decimal = Decimal('0')
+
+
+@dataclass(frozen=True)
+class CartLine:
+	product: Product
+	quantity: int
+	unit_price: Decimal
+	cart_item_id: int = None
+
+	@property
+	def line_total(self):
+		return self.unit_price * self.quantity
+
+	@property
+	def image_url(self):
+		# ProductCard is joined in by snapshot(), so this never queries
+		try:
+			return self.product.card.image_url
+		except ProductCard.DoesNotExist:
+			return ''
+
+	@property
+	def variant_name(self):
+		variants = (self.product.gallery_manifest or {}).get('variants') or []
+		return variants[0]['color_name'] if variants else ''
+
+
+@dataclass(frozen=True)
+class CartSnapshot:
+	"""The cart as loaded once for a request: lines plus their totals"""
+	lines: tuple = ()
+	quantity: int = 0
+	subtotal: Decimal = Decimal('0')
+
+	@classmethod
+	def from_lines(cls, lines):
+		lines = tuple(lines)
+		return cls(
+			lines=lines,
+			quantity=sum(line.quantity for line in lines),
+			subtotal=sum((line.line_total for line in lines), Decimal('0')),
+		)
+
+	def __len__(self):
+		return len(self.lines)
+
+	def __iter__(self):
+		return iter(self.lines)
+
+	@property
+	def item_count(self):
+		return len(self.lines)
+
+	def quantities(self):
+		return {str(line.product.id): line.quantity for line in self.lines}
+
+	def summary(self):
+		return CartSummary(item_count=self.item_count, quantity=self.quantity, subtotal=self.subtotal)
+
+
+def unit_price(product):
+	return product.sale_price if product.is_sale else product.price
+
 
 class Cart():
+	"""
+	A visitor's cart. Lines are stored by a CartBackend (see cart.backends);
+	this class adds pricing, the per-request snapshot and the cached summary.
+	"""
 	def __init__(self, request):
-		self.session = request.session
 		self.request = request
+		self.backend = get_cart_backend(request)
 
-		# For non-authenticated users, use session
-		cart = self.session.get('session_key')
+	def add(self, product, quantity=1):
+		"""Add quantity of product; returns False if the line would exceed stock"""
+		added = self.backend.add(product, quantity)
+		if added:
+			self.invalidate()
+		return added
 
-		if 'session_key' not in request.session:
-			cart = self.session['session_key'] = {}
+	def __len__(self):
+		# Return total number of items
+		return self.summary().item_count
 
-		self.cart = cart
+	def _summary_key(self):
+		owner = self.backend.owner_key()
+		if owner is None:
+			return None
+		# Keyed on the catalog version so price changes show up in the subtotal
+		return f'cart:summary:{get_catalog_version()}:{owner}'
 
-	def add(self, product, quantity=1):
-		product_id = str(product.id)
+	def summary(self):
+		"""Cached CartSummary; a miss costs the one snapshot query"""
+		if hasattr(self, '_summary'):
+			return self._summary
 
-		# Logic for session-based cart
-		if product_id in self.cart:
-			self.cart[product_id]['quantity'] = int(self.cart[product_id].get('quantity', 0)) + quantity
-		else:
-			self.cart[product_id] = {
-				'price': str(product.price),
-				'quantity': quantity
-			}
+		snapshot = getattr(self.request, '_cart_snapshot', None)
+		if snapshot is not None:
+			self._summary = snapshot.summary()
+			return self._summary
 
-		self.session.modified = True
+		key = self._summary_key()
+		summary = cache.get(key) if key else None
+		if summary is None:
+			summary = self.snapshot().summary()
+			if key:
+				cache.set(key, summary, CART_SUMMARY_TIMEOUT)
+		self._summary = summary
+		return summary
 
-	def __len__(self):
-		# Return total number of items
-		if self.request.user.is_authenticated:
-			# Count from database
-			return CartItem.objects.filter(user=self.request.user).count()
-		else:
-			# Count from session
-			return len(self.cart)
-
-	def get_prods(self):
-		if self.request.user.is_authenticated:
-			# Get cart items from database for authenticated users
-			cart_items = CartItem.objects.filter(user=self.request.user).select_related('product')
-			
-			# Return products with their quantities
-			products = []
-			for item in cart_items:
-				product = item.product
-				product.cart_quantity = item.quantity  # Add quantity to product object
-				product.cart_item_id = item.id  # Add cart item id for updates/deletes
-				products.append(product)
-			
-			return products
-		else:
-			# Get products from session for non-authenticated users
-			product_ids = self.cart.keys()
-			products = Product.objects.filter(id__in=product_ids)
-			
-			# Add quantity info from session
-			for product in products:
-				product.cart_quantity = self.cart[str(product.id)].get('quantity', 1)
-			
-			return products
+	def snapshot(self):
+		"""
+		The whole cart in one query, memoised on the request.
+		Later Cart objects built for the same request share it.
+		"""
+		snapshot = getattr(self.request, '_cart_snapshot', None)
+		if snapshot is not None:
+			return snapshot
+
+		lines = [
+			CartLine(product=product, quantity=quantity, unit_price=unit_price(product), cart_item_id=cart_item_id)
+			for product, quantity, cart_item_id in self.backend.load_lines()
+		]
+		snapshot = self.request._cart_snapshot = CartSnapshot.from_lines(lines)
+		return snapshot
+
+	def invalidate(self):
+		"""Drop the memoised snapshot and the cached summary; called after every change to the cart"""
+		self.__dict__.pop('_summary', None)
+		self.request.__dict__.pop('_cart_snapshot', None)
+		key = self._summary_key()
+		if key:
+			cache.delete(key)
 
 	def get_quantities(self):
 		"""Get dictionary of product quantities"""
-		if self.request.user.is_authenticated:
-			cart_items = CartItem.objects.filter(user=self.request.user)
-			return {str(item.product.id): item.quantity for item in cart_items}
-		else:
-			return {pid: data.get('quantity', 1) for pid, data in self.cart.items()}
+		return self.snapshot().quantities()
 
 	def update(self, product_id, quantity):
 		"""Update quantity of a cart item"""
-		if self.request.user.is_authenticated:
-			try:
-				cart_item = CartItem.objects.get(user=self.request.user, product_id=product_id)
-				cart_item.quantity = quantity
-				cart_item.save()
-				return True
-			except CartItem.DoesNotExist:
-				return False
-		else:
-			product_id = str(product_id)
-			if product_id in self.cart:
-				self.cart[product_id]['quantity'] = quantity
-				self.session.modified = True
-				return True
-			return False
+		updated = self.backend.update(int(product_id), quantity)
+		if updated:
+			self.invalidate()
+		return updated
 
 	def delete(self, product_id):
 		"""Remove item from cart"""
-		if self.request.user.is_authenticated:
-			try:
-				cart_item = CartItem.objects.get(user=self.request.user, product_id=product_id)
-				cart_item.delete()
-				return True
-			except CartItem.DoesNotExist:
-				return False
-		else:
-			product_id = str(product_id)
-			if product_id in self.cart:
-				del self.cart[product_id]
-				self.session.modified = True
-				return True
-			return False
-
-	def get_total(self):
-		"""Calculate cart total"""
-		if self.request.user.is_authenticated:
-			cart_items = CartItem.objects.filter(user=self.request.user).select_related('product')
-			total = sum(item.product.sale_price * item.quantity if item.product.is_sale 
-					   else item.product.price * item.quantity 
-					   for item in cart_items)
-		else:
-			product_ids = self.cart.keys()
-			products = Product.objects.filter(id__in=product_ids)
-			total = sum((product.sale_price if product.is_sale else product.price) * 
-					   self.cart[str(product.id)].get('quantity', 1)
-					   for product in products)
-		
-		return total
+		removed = self.backend.remove(int(product_id))
+		if removed:
+			self.invalidate()
+		return removed
+
+	def set_quantities(self, quantities):
+		"""Write final quantities {product_id: quantity} in one go; 0 removes the line"""
+		self.backend.set_quantities(quantities)
+		self.invalidate()
+
+	def flush(self):
+		"""Make sure buffered writes have reached CartItem, e.g. before checkout"""
+		self.backend.flush()
+
+	def clear(self):
+		"""Empty the cart after a completed order"""
+		self.backend.clear()
+		self.invalidate()
+
+	def price(self, coupon=None):
+		"""PriceBreakdown of this cart with coupon applied, memoised per request"""
+		return price_cart(self, coupon)
 
 	def merge_to_database(self, user):
-		"""Merge session cart to database when user logs in"""
-		# Store session cart before it gets cleared
-		session_cart_data = dict(self.cart) if self.cart else {}
-		
-		if not session_cart_data:
+		"""Merge the guest cart into the signed-in user's cart when they log in"""
+		guest = get_guest_cart_backend(self.request)
+		quantities = guest.quantities()
+		if not quantities:
 			return
-		
-		for product_id, data in session_cart_data.items():
-			try:
-				product = Product.objects.get(id=product_id)
-				quantity = data.get('quantity', 1)
-				
-				cart_item, created = CartItem.objects.get_or_create(
-					user=user,
-					product=product
-				)
-				
-				if created:
-					cart_item.quantity = quantity
-				else:
-					cart_item.quantity += quantity
-				
-				cart_item.save()
-				
-			except Product.DoesNotExist:
-				continue
-		
-		# Clear session cart
-		self.cart.clear()
-		self.session.modified = True
\ No newline at end of file
+
+		self.backend.merge(quantities)
+		guest.clear()
+		self.invalidate()
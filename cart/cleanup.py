@@ -0,0 +1,51 @@
+from datetime import timedelta
+from importlib import import_module
+from django.conf import settings
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from store.models import CartItem
+
+# A saved cart line counts as abandoned once both it and its owner's last login are this old
+CART_ITEM_MAX_AGE = timedelta(days=getattr(settings, 'CART_ITEM_MAX_AGE_DAYS', 90))
+CLEANUP_BATCH_SIZE = getattr(settings, 'CART_CLEANUP_BATCH_SIZE', 1000)
+
+
+def delete_stale_cart_items(max_age=CART_ITEM_MAX_AGE, batch_size=CLEANUP_BATCH_SIZE, now=None):
+	"""
+	Delete abandoned CartItem rows; returns how many were removed.
+
+	Walks the table in primary-key windows of batch_size, one short
+	statement each, so no delete holds locks across the whole table.
+	"""
+	cutoff = (now or timezone.now()) - max_age
+	stale = CartItem.objects.filter(added_at__lt=cutoff).filter(
+		Q(user__last_login__isnull=True) | Q(user__last_login__lt=cutoff)
+	)
+	bounds = stale.aggregate(low=Min('id'), high=Max('id'))
+	if bounds['low'] is None:
+		return 0
+
+	deleted = 0
+	for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+		deleted += stale.filter(id__gte=start, id__lt=start + batch_size).delete()[0]
+	return deleted
+
+
+def delete_expired_sessions(batch_size=CLEANUP_BATCH_SIZE, now=None):
+	"""
+	Delete expired database sessions in batches; returns how many were removed.
+	Engines without a session table are asked to clear_expired() themselves.
+	"""
+	store = import_module(settings.SESSION_ENGINE).SessionStore
+	if not hasattr(store, 'get_model_class'):
+		store.clear_expired()
+		return 0
+
+	sessions = store.get_model_class().objects
+	now = now or timezone.now()
+	deleted = 0
+	while True:
+		keys = list(sessions.filter(expire_date__lt=now).values_list('session_key', flat=True)[:batch_size])
+		if not keys:
+			return deleted
+		deleted += sessions.filter(session_key__in=keys).delete()[0]
@@ -1,6 +1,11 @@
+from django.utils.functional import SimpleLazyObject
 from .cart import Cart
 
 #Create context processors so cart will work on all pages
 def cart(request):
-	return {'cart': Cart(request)}
-
+	# Nothing is read until a template actually uses the cart
+	cart = SimpleLazyObject(lambda: Cart(request))
+	return {
+		'cart': cart,
+		'cart_summary': SimpleLazyObject(lambda: cart.summary()),
+	}
@@ -0,0 +1,50 @@
+import random
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from cart.cart import CartSnapshot
+from cart.pricing import price, price_cart, price_many
+from payment.models import Coupon
+
+
+class Command(BaseCommand):
+	help = "Benchmark cart pricing: single carts, the per-request memo and batch mode"
+
+	def add_arguments(self, parser):
+		parser.add_argument('--carts', type=int, default=100000)
+		parser.add_argument('--seed', type=int, default=42)
+
+	def handle(self, *args, **options):
+		rng = random.Random(options['seed'])
+		# Shelf prices repeat a lot, so do cart subtotals
+		shelf = [Decimal(rng.randint(199, 99999)) / 100 for _ in range(500)]
+		subtotals = [
+			sum((rng.choice(shelf) * rng.randint(1, 3) for _ in range(rng.randint(1, 6))), Decimal('0'))
+			for _ in range(options['carts'])
+		]
+		coupon = Coupon(
+			code='BENCH',
+			discount_type='percentage',
+			discount_value=Decimal('15'),
+			max_discount=Decimal('50'),
+			min_order_value=Decimal('20'),
+		)
+
+		def timed(label, run):
+			started = time.perf_counter()
+			run()
+			seconds = time.perf_counter() - started
+			self.stdout.write(
+				f"{label:<24} {seconds * 1000:9.1f}ms  {seconds / len(subtotals) * 1e6:7.2f}us/cart"
+			)
+
+		self.stdout.write(f"carts: {len(subtotals)}  distinct subtotals: {len(set(subtotals))}")
+		timed('price, no coupon', lambda: [price(subtotal) for subtotal in subtotals])
+		timed('price, coupon', lambda: [price(subtotal, coupon) for subtotal in subtotals])
+		timed('price_many, coupon', lambda: price_many(subtotals, coupon))
+
+		# What a page that prices the same cart several times pays after the first call
+		snapshot = CartSnapshot(subtotal=subtotals[0])
+		cart = SimpleNamespace(request=SimpleNamespace(), snapshot=lambda: snapshot)
+		timed('price_cart, memo hit', lambda: [price_cart(cart, coupon) for _ in subtotals])
@@ -0,0 +1,25 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from cart.cleanup import delete_stale_cart_items, delete_expired_sessions, CART_ITEM_MAX_AGE, CLEANUP_BATCH_SIZE
+
+
+class Command(BaseCommand):
+	help = "Delete abandoned cart lines and expired sessions; run daily from cron"
+
+	def add_arguments(self, parser):
+		parser.add_argument('--days', type=int, default=CART_ITEM_MAX_AGE.days)
+		parser.add_argument('--batch-size', type=int, default=CLEANUP_BATCH_SIZE)
+		parser.add_argument('--skip-sessions', action='store_true')
+
+	def handle(self, *args, **options):
+		started = time.perf_counter()
+		items = delete_stale_cart_items(max_age=timedelta(days=options['days']), batch_size=options['batch_size'])
+		self.stdout.write(f"Deleted {items} cart item(s) in {time.perf_counter() - started:.2f}s.")
+
+		if not options['skip_sessions']:
+			started = time.perf_counter()
+			sessions = delete_expired_sessions(batch_size=options['batch_size'])
+			self.stdout.write(f"Deleted {sessions} expired session(s) in {time.perf_counter() - started:.2f}s.")
+
+		self.stdout.write(self.style.SUCCESS("Cleanup finished."))
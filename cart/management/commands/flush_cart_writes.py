@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from cart.backends import CacheCartBackend, FLUSH_BATCH_SIZE
+
+
+class Command(BaseCommand):
+	help = "Write carts changed in the cache cart backend back to CartItem; run every minute or so"
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=FLUSH_BATCH_SIZE)
+
+	def handle(self, *args, **options):
+		count = CacheCartBackend.flush_pending(batch_size=options['batch_size'])
+		self.stdout.write(self.style.SUCCESS(f"Flushed {count} cart(s)."))
@@ -0,0 +1,27 @@
+from django.conf import settings
+from .backends import COOKIE_NAME, COOKIE_MAX_AGE, PENDING_COOKIE_ATTR
+
+
+class GuestCartCookieMiddleware:
+	"""Writes the cookie SignedCookieCartBackend left on the request, if the cart changed"""
+	def __init__(self, get_response):
+		self.get_response = get_response
+
+	def __call__(self, request):
+		response = self.get_response(request)
+
+		value = getattr(request, PENDING_COOKIE_ATTR, None)
+		if value is None:
+			return response
+		if value:
+			response.set_cookie(
+				COOKIE_NAME,
+				value,
+				max_age=COOKIE_MAX_AGE,
+				secure=settings.SESSION_COOKIE_SECURE,
+				httponly=True,
+				samesite='Lax',
+			)
+		else:
+			response.delete_cookie(COOKIE_NAME, samesite='Lax')
+		return response
@@ -0,0 +1,77 @@
+from dataclasses import dataclass
+from decimal import Decimal
+from django.conf import settings
+
+TAX_RATE = Decimal(str(getattr(settings, 'CART_TAX_RATE', '0.1')))
+ZERO = Decimal('0')
+# Memo of the last breakdown priced for this request, see price_cart()
+PRICING_ATTR = '_cart_pricing'
+
+
+@dataclass(frozen=True)
+class PriceBreakdown:
+	"""Subtotal, coupon discount, tax on the discounted subtotal, and what the customer pays"""
+	subtotal: Decimal = ZERO
+	discount: Decimal = ZERO
+	tax: Decimal = ZERO
+	total: Decimal = ZERO
+
+	@property
+	def discounted_subtotal(self):
+		return self.subtotal - self.discount
+
+	def as_json(self):
+		return {
+			'subtotal': str(self.subtotal),
+			'discount': str(self.discount),
+			'tax': str(self.tax),
+			'total': str(self.total),
+		}
+
+
+def coupon_discount(coupon, subtotal):
+	"""What coupon takes off subtotal; nothing below its minimum order value"""
+	if coupon is None or subtotal < coupon.min_order_value:
+		return ZERO
+	return coupon.calculate_discount(subtotal)
+
+
+def price(subtotal, coupon=None):
+	discount = coupon_discount(coupon, subtotal)
+	tax = (subtotal - discount) * TAX_RATE
+	return PriceBreakdown(subtotal=subtotal, discount=discount, tax=tax, total=subtotal - discount + tax)
+
+
+def price_snapshot(snapshot, coupon=None):
+	return price(snapshot.subtotal, coupon)
+
+
+def price_cart(cart, coupon=None):
+	"""
+	Price a Cart's snapshot, once per request for each coupon. The memo is
+	tied to the snapshot object, so Cart.invalidate() also retires it.
+	"""
+	snapshot = cart.snapshot()
+	coupon_key = coupon.pk if coupon is not None else None
+	memo = getattr(cart.request, PRICING_ATTR, None)
+	if memo is not None and memo[0] is snapshot and memo[1] == coupon_key:
+		return memo[2]
+
+	breakdown = price_snapshot(snapshot, coupon)
+	setattr(cart.request, PRICING_ATTR, (snapshot, coupon_key, breakdown))
+	return breakdown
+
+
+def price_many(subtotals, coupon=None):
+	"""
+	Batch mode for reports and simulations: one PriceBreakdown per subtotal,
+	in order. Equal subtotals are priced once.
+	"""
+	priced = {}
+	results = []
+	for subtotal in subtotals:
+		breakdown = priced.get(subtotal)
+		if breakdown is None:
+			breakdown = priced[subtotal] = price(subtotal, coupon)
+		results.append(breakdown)
+	return results
@@ -1,3 +1,370 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from decimal import Decimal
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from payment.models import Coupon
+from store.models import Category, Product, CartItem
+from store.testing import LOCMEM_CACHES, run_in_threads
+from .backends import CacheCartBackend, DatabaseCartBackend, COOKIE_NAME, PENDING_COOKIE_ATTR
+from .cart import Cart
+from .cleanup import delete_stale_cart_items
+from .pricing import price, price_many
+from .views import cart_batch, cart_summary
 
-# Create your tests here.
+@override_settings(CACHES=LOCMEM_CACHES, CART_BACKEND='cart.backends.CacheCartBackend')
+class CacheCartBackendTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = get_user_model().objects.create_user(email='shopper@example.com', password='secret')
+		category = Category.objects.create(name='Lamps')
+		self.lamp = Product.objects.create(name='Desk Lamp', price=40, stock=10, category=category)
+		self.shade = Product.objects.create(name='Lamp Shade', price=15, stock=10, category=category)
+
+	def cart(self):
+		request = RequestFactory().get('/')
+		request.user = self.user
+		request.session = SessionStore()
+		return Cart(request)
+
+	def test_changes_stay_in_cache_until_flushed(self):
+		cart = self.cart()
+		cart.add(self.lamp, 2)
+		cart.add(self.lamp, 1)
+		cart.add(self.shade, 4)
+
+		self.assertFalse(CartItem.objects.exists())
+		self.assertEqual(self.cart().get_quantities(), {str(self.lamp.id): 3, str(self.shade.id): 4})
+
+		self.assertEqual(CacheCartBackend.flush_pending(), 1)
+		self.assertEqual(
+			dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+			{self.lamp.id: 3, self.shade.id: 4}
+		)
+
+	def test_flush_writes_updates_and_removals(self):
+		cart = self.cart()
+		cart.add(self.lamp, 2)
+		cart.add(self.shade, 1)
+		CacheCartBackend.flush_pending()
+
+		cart = self.cart()
+		cart.update(self.lamp.id, 5)
+		cart.delete(self.shade.id)
+		self.assertEqual(CartItem.objects.get(user=self.user, product=self.lamp).quantity, 2)
+
+		CacheCartBackend.flush_pending()
+		self.assertEqual(
+			dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+			{self.lamp.id: 5}
+		)
+		self.assertEqual(CacheCartBackend.flush_pending(), 0)
+
+	def test_checkout_flush_writes_only_this_cart(self):
+		cart = self.cart()
+		cart.add(self.lamp, 1)
+		cart.flush()
+
+		self.assertEqual(CartItem.objects.get(user=self.user, product=self.lamp).quantity, 1)
+		self.assertEqual(CacheCartBackend.flush_pending(), 0)
+
+	def test_cold_cache_reads_database(self):
+		CartItem.objects.create(user=self.user, product=self.shade, quantity=2)
+		self.assertEqual(self.cart().get_quantities(), {str(self.shade.id): 2})
+
+
+@override_settings(CART_GUEST_BACKEND='cart.backends.SignedCookieCartBackend')
+class SignedCookieCartBackendTests(TestCase):
+	def setUp(self):
+		category = Category.objects.create(name='Lamps')
+		self.lamp = Product.objects.create(name='Desk Lamp', price=40, stock=10, category=category)
+
+	def guest_request(self, cookie=None):
+		request = RequestFactory().get('/')
+		request.user = AnonymousUser()
+		request.session = SessionStore()
+		if cookie is not None:
+			request.COOKIES[COOKIE_NAME] = cookie
+		return request
+
+	def test_cart_round_trips_through_cookie_without_session(self):
+		request = self.guest_request()
+		self.assertTrue(Cart(request).add(self.lamp, 2))
+		self.assertFalse(request.session.modified)
+
+		cookie = getattr(request, PENDING_COOKIE_ATTR)
+		self.assertEqual(Cart(self.guest_request(cookie)).get_quantities(), {str(self.lamp.id): 2})
+
+	def test_tampered_cookie_reads_as_empty(self):
+		request = self.guest_request()
+		Cart(request).add(self.lamp, 2)
+		cookie = getattr(request, PENDING_COOKIE_ATTR).replace(f'{self.lamp.id}-2', f'{self.lamp.id}-9')
+
+		self.assertEqual(Cart(self.guest_request(cookie)).get_quantities(), {})
+
+	def test_login_merges_cookie_cart(self):
+		request = self.guest_request()
+		Cart(request).add(self.lamp, 3)
+
+		request.user = get_user_model().objects.create_user(email='guest@example.com', password='secret')
+		Cart(request).merge_to_database(request.user)
+
+		self.assertEqual(CartItem.objects.get(user=request.user, product=self.lamp).quantity, 3)
+		self.assertEqual(getattr(request, PENDING_COOKIE_ATTR), '')
+
+
+class PricingTests(SimpleTestCase):
+	def setUp(self):
+		self.coupon = Coupon(
+			code='TEN',
+			discount_type='percentage',
+			discount_value=Decimal('10'),
+			max_discount=Decimal('15'),
+			min_order_value=Decimal('50'),
+		)
+
+	def test_tax_is_charged_on_the_discounted_subtotal(self):
+		prices = price(Decimal('100'), self.coupon)
+
+		self.assertEqual(prices.discount, Decimal('10'))
+		self.assertEqual(prices.tax, Decimal('9'))
+		self.assertEqual(prices.total, Decimal('99'))
+
+	def test_coupon_respects_minimum_and_cap(self):
+		below, capped = price_many([Decimal('40'), Decimal('400')], self.coupon)
+
+		self.assertEqual(below.discount, Decimal('0'))
+		self.assertEqual(capped.discount, Decimal('15'))
+
+
+class StaleCartCleanupTests(TestCase):
+	def test_only_lines_of_absent_users_are_deleted(self):
+		category = Category.objects.create(name='Lamps')
+		lamp = Product.objects.create(name='Desk Lamp', price=40, stock=10, category=category)
+		long_ago = timezone.now() - timedelta(days=365)
+		gone = get_user_model().objects.create_user(email='gone@example.com', password='secret', last_login=long_ago)
+		back = get_user_model().objects.create_user(email='back@example.com', password='secret', last_login=timezone.now())
+		CartItem.objects.bulk_create([CartItem(user=gone, product=lamp), CartItem(user=back, product=lamp)])
+		CartItem.objects.update(added_at=long_ago)
+
+		self.assertEqual(delete_stale_cart_items(batch_size=1), 1)
+		self.assertEqual(list(CartItem.objects.values_list('user', flat=True)), [back.id])
+
+
+class ConcurrentAddTests(TransactionTestCase):
+	"""Parallel adds through DatabaseCartBackend must neither lose increments nor pass stock"""
+	THREADS = 8
+	ADDS_PER_THREAD = 5
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(email='racer@example.com', password='secret')
+		self.category = Category.objects.create(name='Flash Sale')
+
+	def backend(self):
+		request = RequestFactory().post('/')
+		request.user = self.user
+		return DatabaseCartBackend(request)
+
+	def run_parallel(self, product):
+		return run_in_threads(
+			lambda backend: backend.add(product, 1),
+			self.THREADS, repeat=self.ADDS_PER_THREAD, setup=lambda index: self.backend()
+		)
+
+	def test_parallel_adds_are_all_counted(self):
+		product = Product.objects.create(name='Lantern', price=20, stock=1000, category=self.category)
+
+		results = self.run_parallel(product)
+
+		self.assertTrue(all(results))
+		self.assertEqual(CartItem.objects.filter(user=self.user, product=product).count(), 1)
+		self.assertEqual(
+			CartItem.objects.get(user=self.user, product=product).quantity,
+			self.THREADS * self.ADDS_PER_THREAD
+		)
+
+	def test_parallel_adds_stop_at_stock(self):
+		product = Product.objects.create(name='Last Lantern', price=20, stock=12, category=self.category)
+
+		results = self.run_parallel(product)
+
+		self.assertEqual(results.count(True), 12)
+		self.assertEqual(CartItem.objects.get(user=self.user, product=product).quantity, 12)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CartSummaryTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = get_user_model().objects.create_user(email='shopper@example.com', password='secret')
+		category = Category.objects.create(name='Lamps')
+		self.lamp = Product.objects.create(name='Desk Lamp', price=40, stock=10, category=category)
+		self.shade = Product.objects.create(name='Lamp Shade', price=15, stock=10, category=category)
+
+	def cart(self):
+		request = RequestFactory().get('/')
+		request.user = self.user
+		request.session = SessionStore()
+		return Cart(request)
+
+	def test_summary_is_served_from_cache(self):
+		self.cart().add(self.lamp, 2)
+		self.cart().summary()
+
+		with self.assertNumQueries(0):
+			summary = self.cart().summary()
+		self.assertEqual((summary.item_count, summary.quantity, summary.subtotal), (1, 2, Decimal('80')))
+
+	def test_changes_and_price_updates_replace_the_summary(self):
+		self.cart().add(self.lamp, 2)
+		self.cart().summary()
+
+		self.cart().add(self.shade, 1)
+		self.assertEqual(self.cart().summary().subtotal, Decimal('95'))
+
+		self.lamp.price = 30
+		with self.captureOnCommitCallbacks(execute=True):
+			self.lamp.save()
+		self.assertEqual(self.cart().summary().subtotal, Decimal('75'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CartSnapshotTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = get_user_model().objects.create_user(email='shopper@example.com', password='secret')
+		self.category = Category.objects.create(name='Lamps')
+
+	def request(self):
+		request = RequestFactory().get('/cart/')
+		request.user = self.user
+		request.session = SessionStore()
+		return request
+
+	def fill_cart(self, line_count):
+		products = Product.objects.bulk_create([
+			Product(name=f'Lamp {number}', slug=f'lamp-{line_count}-{number}', price=10, stock=5, category=self.category)
+			for number in range(line_count)
+		])
+		CartItem.objects.filter(user=self.user).delete()
+		CartItem.objects.bulk_create([CartItem(user=self.user, product=product, quantity=2) for product in products])
+
+	def page_queries(self, line_count):
+		self.fill_cart(line_count)
+		with CaptureQueriesContext(connection) as queries:
+			response = cart_summary(self.request())
+		self.assertEqual(response.status_code, 200)
+		return len(queries)
+
+	def test_cart_page_queries_do_not_grow_with_the_cart(self):
+		counts = [self.page_queries(line_count) for line_count in (1, 10, 20)]
+
+		self.assertEqual(counts, [counts[0]] * 3)
+
+	def test_one_snapshot_per_request(self):
+		self.fill_cart(3)
+		request = self.request()
+
+		with self.assertNumQueries(1):
+			snapshot = Cart(request).snapshot()
+			Cart(request).price()
+			len(Cart(request))
+		self.assertEqual((len(snapshot), snapshot.quantity, snapshot.subtotal), (3, 6, Decimal('60')))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CartMergeTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = get_user_model().objects.create_user(email='shopper@example.com', password='secret')
+		category = Category.objects.create(name='Lamps')
+		self.lamp = Product.objects.create(name='Desk Lamp', price=40, stock=10, category=category)
+		self.shade = Product.objects.create(name='Lamp Shade', price=15, stock=10, category=category)
+
+	def test_login_adds_guest_quantities_onto_saved_lines(self):
+		CartItem.objects.create(user=self.user, product=self.lamp, quantity=2)
+		request = RequestFactory().get('/')
+		request.user = AnonymousUser()
+		request.session = SessionStore()
+		Cart(request).add(self.lamp, 3)
+		Cart(request).add(self.shade, 1)
+
+		request.user = self.user
+		Cart(request).merge_to_database(self.user)
+
+		self.assertEqual(
+			dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+			{self.lamp.id: 5, self.shade.id: 1}
+		)
+		self.assertEqual(request.session['session_key'], {})
+
+	def test_lines_of_deleted_products_are_dropped(self):
+		request = RequestFactory().get('/')
+		request.user = self.user
+
+		DatabaseCartBackend(request).merge({self.lamp.id: 1, self.shade.id + 1000: 4})
+
+		self.assertEqual(
+			dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+			{self.lamp.id: 1}
+		)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CartBatchTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = get_user_model().objects.create_user(email='shopper@example.com', password='secret')
+		category = Category.objects.create(name='Lamps')
+		self.lamp = Product.objects.create(name='Desk Lamp', price=40, stock=10, category=category)
+		self.shade = Product.objects.create(name='Lamp Shade', price=15, stock=10, category=category)
+		CartItem.objects.create(user=self.user, product=self.lamp, quantity=1)
+
+	def batch(self, *operations):
+		request = RequestFactory().post(
+			'/cart/batch/', json.dumps({'operations': list(operations)}), content_type='application/json'
+		)
+		request.user = self.user
+		request.session = SessionStore()
+		response = cart_batch(request)
+		return response.status_code, json.loads(response.content)
+
+	def lines(self):
+		return dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+
+	def test_operations_fold_into_final_quantities(self):
+		status, body = self.batch(
+			{'op': 'add', 'product_id': self.lamp.id, 'quantity': 2},
+			{'op': 'add', 'product_id': self.lamp.id},
+			{'op': 'update', 'product_id': self.shade.id, 'quantity': 5},
+			{'op': 'add', 'product_id': self.shade.id, 'quantity': 2},
+		)
+
+		self.assertEqual(status, 200)
+		self.assertEqual(self.lines(), {self.lamp.id: 4, self.shade.id: 7})
+		self.assertEqual(body['cart_quantity'], 2)
+
+	def test_delete_then_add_starts_from_zero(self):
+		self.batch(
+			{'op': 'delete', 'product_id': self.lamp.id},
+			{'op': 'add', 'product_id': self.lamp.id, 'quantity': 3},
+		)
+
+		self.assertEqual(self.lines(), {self.lamp.id: 3})
+
+	def test_overstock_rejects_the_whole_batch(self):
+		status, body = self.batch(
+			{'op': 'add', 'product_id': self.shade.id, 'quantity': 2},
+			{'op': 'add', 'product_id': self.lamp.id, 'quantity': 6},
+			{'op': 'add', 'product_id': self.lamp.id, 'quantity': 6},
+		)
+
+		self.assertEqual(status, 400)
+		self.assertEqual(body['errors'], [{'product_id': self.lamp.id, 'error': 'Invalid quantity'}])
+		self.assertEqual(self.lines(), {self.lamp.id: 1})
@@ -1,24 +1,22 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from .cart import Cart
-from store.models import Product, ProductVariant, ProductImage, CartItem
+from .pricing import price_snapshot
+from payment.reservations import available_quantities, available_stock
+from store.models import Product, ProductVariant, ProductImage
 from django.http import JsonResponse
-from decimal import Decimal
+from django.views.decorators.http import require_POST
+import json
 
 # Create your views here.
 def cart_summary(request):
 	cart = Cart(request)
-	cart_products = cart.get_prods()
-	quantities = cart.get_quantities()
-	subtotal = cart.get_total()
-	tax = subtotal * Decimal('0.1')
-	total = subtotal + tax
+	prices = cart.price()
 	
 	return render(request, "cart_summary.html", {
-		'cart_products': cart_products,
-		'quantities': quantities,
-		'subtotal': subtotal,
-		'tax': tax,
-		'total': total
+		'cart_lines': cart.snapshot().lines,
+		'subtotal': prices.subtotal,
+		'tax': prices.tax,
+		'total': prices.total
 	})
 
 	
@@ -30,24 +28,13 @@ def cart_add(request):
 		quantity = int(request.POST.get('quantity', 1))
 		product = get_object_or_404(Product, id=product_id)
 
-		# Validate quantity
-		if quantity < 1 or quantity > product.stock:
+		# Validate quantity; units held for other pending orders are not for sale
+		if quantity < 1 or quantity > available_stock(product):
 			return JsonResponse({'success': False, 'error': 'Invalid quantity'}, status=400)
 
-		if request.user.is_authenticated:
-			# Save to database for logged-in user
-			item, created = CartItem.objects.get_or_create(
-				user=request.user, 
-				product=product
-			)
-			if created:
-				item.quantity = quantity
-			else:
-				item.quantity += quantity  
-			item.save()
-		else:
-			# Save to session for guest users
-			cart.add(product=product, quantity=quantity)
+		# The backend checks the new line total against stock in the same statement
+		if not cart.add(product=product, quantity=quantity):
+			return JsonResponse({'success': False, 'error': 'Not enough stock'}, status=400)
 
 		cart_quantity = cart.__len__()
 		return JsonResponse({'success': True, 'qty': cart_quantity})
@@ -61,16 +48,13 @@ def cart_delete(request):
 	if request.POST.get('action') == 'post':
 		product_id = int(request.POST.get('product_id'))
 		success = cart.delete(product_id)
-		cart_quantity = cart.__len__()
-		subtotal = cart.get_total()
-		tax = subtotal * Decimal('0.1')
-		total = subtotal + tax
+		prices = cart.price()
 		return JsonResponse({
 			'success': success,
-			'cart_quantity': cart_quantity,
-			'subtotal': str(subtotal),
-			'tax': str(tax),
-			'total': str(total)
+			'cart_quantity': len(cart.snapshot()),
+			'subtotal': str(prices.subtotal),
+			'tax': str(prices.tax),
+			'total': str(prices.total)
 		})
 	return JsonResponse({'success': False, 'error': 'Invalid request'}, status=400)
 
@@ -83,22 +67,79 @@ def cart_update(request):
 		
 		# Validate quantity
 		product = get_object_or_404(Product, id=product_id)
-		if quantity < 1 or quantity > product.stock:
+		if quantity < 1 or quantity > available_stock(product):
 			return JsonResponse({'success': False, 'error': 'Invalid quantity'}, status=400)
 		
 		# Update cart
 		success = cart.update(product_id, quantity)
 		
 		# Calculate new totals
-		subtotal = cart.get_total()
-		tax = subtotal * Decimal('0.1')
-		total = subtotal + tax
+		prices = cart.price()
 		
 		return JsonResponse({
 			'success': success,
-			'subtotal': str(subtotal),
-			'tax': str(tax),
-			'total': str(total)
+			'subtotal': str(prices.subtotal),
+			'tax': str(prices.tax),
+			'total': str(prices.total)
 		})
 	
-	return JsonResponse({'success': False, 'error': 'Invalid request'}, status=400)
\ No newline at end of file
+	return JsonResponse({'success': False, 'error': 'Invalid request'}, status=400)
+
+
+def _snapshot_payload(snapshot):
+	prices = price_snapshot(snapshot)
+	return {
+		'cart_quantity': len(snapshot),
+		'lines': [
+			{
+				'product_id': line.product.id,
+				'quantity': line.quantity,
+				'unit_price': str(line.unit_price),
+				'line_total': str(line.line_total),
+			}
+			for line in snapshot
+		],
+		'subtotal': str(prices.subtotal),
+		'tax': str(prices.tax),
+		'total': str(prices.total),
+	}
+
+
+@require_POST
+def cart_batch(request):
+	"""
+	Apply several cart operations in one request. Body:
+	{"operations": [{"op": "add" | "update" | "delete", "product_id": 1, "quantity": 2}, ...]}
+	Nothing is written unless every resulting quantity is valid.
+	"""
+	try:
+		operations = json.loads(request.body)['operations']
+		parsed = [(op['op'], int(op['product_id']), int(op.get('quantity', 1))) for op in operations]
+	except (ValueError, KeyError, TypeError):
+		return JsonResponse({'success': False, 'error': 'Invalid request'}, status=400)
+
+	cart = Cart(request)
+	current = {int(product_id): quantity for product_id, quantity in cart.snapshot().quantities().items()}
+
+	# Fold the operations into one final quantity per product
+	targets = {}
+	for action, product_id, quantity in parsed:
+		if action == 'delete':
+			targets[product_id] = 0
+		elif action in ('add', 'update') and quantity >= 1:
+			base = targets.get(product_id, current.get(product_id, 0)) if action == 'add' else 0
+			targets[product_id] = base + quantity
+		else:
+			return JsonResponse({'success': False, 'error': 'Invalid operation', 'product_id': product_id}, status=400)
+
+	stock = available_quantities(targets)
+	errors = [
+		{'product_id': product_id, 'error': 'Product not found' if product_id not in stock else 'Invalid quantity'}
+		for product_id, quantity in targets.items()
+		if quantity and (product_id not in stock or quantity > stock[product_id])
+	]
+	if errors:
+		return JsonResponse({'success': False, 'errors': errors}, status=400)
+
+	cart.set_quantities(targets)
+	return JsonResponse({'success': True, **_snapshot_payload(cart.snapshot())})
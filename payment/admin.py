@@ -1,11 +1,20 @@
 from django.contrib import admin
-from .models import ShippingAddress, OrderItem, Order, Coupon, CouponUsage
+from .models import ShippingAddress, OrderItem, Order, Coupon, CouponUsage, StockReservation, ExchangeRate
 
 
 # Register your models here.
 admin.site.register(ShippingAddress)
-admin.site.register(OrderItem)
 admin.site.register(Order)
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(admin.ModelAdmin):
+	list_display = ['order', 'product', 'quantity', 'price', 'stock_short']
+	# Paid lines the stock could not cover
+	list_filter = ['stock_short']
+	search_fields = ['order__order_number']
+
+
 @admin.register(Coupon)
 class CouponAdmin(admin.ModelAdmin):
 	list_display = [
@@ -31,7 +40,7 @@ class CouponAdmin(admin.ModelAdmin):
 			'fields': ('discount_type', 'discount_value', 'max_discount', 'min_order_value')
 		}),
 		('Usage Limits', {
-			'fields': ('max_uses', 'max_uses_per_user', 'current_uses')
+			'fields': ('max_uses', 'max_uses_per_user', 'current_uses', 'counter_shards')
 		}),
 		('Validity Period', {
 			'fields': ('valid_from', 'valid_until')
@@ -57,4 +66,16 @@ class CouponUsageAdmin(admin.ModelAdmin):
 	
 	def has_add_permission(self, request):
 		# Prevent manual creation of usage records
-		return False
\ No newline at end of file
+		return False
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+	list_display = ['order', 'product', 'quantity', 'created_at', 'expires_at']
+	list_select_related = ['order', 'product']
+	raw_id_fields = ['order', 'product']
+
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+	list_display = ['base', 'quote', 'rate', 'fetched_at']
@@ -0,0 +1,120 @@
+import json
+import logging
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+import requests
+from .models import ExchangeRate
+
+logger = logging.getLogger(__name__)
+
+RATE_URL = getattr(settings, 'EXCHANGE_RATE_URL', 'https://api.exchangerate-api.com/v4/latest/USD')
+# How long a fetched rate is good for
+RATE_TTL = getattr(settings, 'EXCHANGE_RATE_TTL', 60 * 60)
+# Refresh-ahead: past this fraction of RATE_TTL the next read starts a background refresh,
+# so under steady traffic the cached rate is replaced before it is RATE_TTL old
+REFRESH_AHEAD = getattr(settings, 'EXCHANGE_RATE_REFRESH_AHEAD', 0.8)
+FETCH_TIMEOUT = getattr(settings, 'EXCHANGE_RATE_TIMEOUT', 3)
+# Only used before any rate has ever been fetched
+FALLBACK_RATE = Decimal(str(getattr(settings, 'EXCHANGE_RATE_FALLBACK', '25000')))
+RATE_KEY = 'fx:{}:{}'
+REFRESH_LOCK_KEY = 'fx:{}:{}:refreshing'
+
+
+class RateUnavailable(Exception):
+	pass
+
+
+def fetch_usd_rates(timeout=FETCH_TIMEOUT):
+	"""{currency: rate} against USD from EXCHANGE_RATE_URL"""
+	try:
+		response = requests.get(RATE_URL, timeout=timeout)
+		response.raise_for_status()
+		return response.json()['rates']
+	except (requests.RequestException, ValueError, KeyError) as e:
+		raise RateUnavailable(str(e)) from e
+
+
+def fetch_fixture_rates(timeout=FETCH_TIMEOUT):
+	"""
+	Stand-in fetcher for tests and offline development: reads a saved API
+	response from EXCHANGE_RATE_FIXTURE instead of calling the network.
+	"""
+	with open(settings.EXCHANGE_RATE_FIXTURE) as f:
+		return json.load(f)['rates']
+
+
+def _fetcher():
+	return import_string(getattr(settings, 'EXCHANGE_RATE_FETCHER', 'payment.exchange_rates.fetch_usd_rates'))
+
+
+def refresh_rate(base='USD', quote='VND'):
+	"""Fetch the rate now, then persist and cache it. Raises RateUnavailable."""
+	try:
+		rate = Decimal(str(_fetcher()(timeout=FETCH_TIMEOUT)[quote]))
+	except (KeyError, InvalidOperation) as e:
+		raise RateUnavailable(f"No {quote} rate in response") from e
+	if rate <= 0:
+		raise RateUnavailable(f"Non-positive {quote} rate {rate}")
+
+	fetched_at = timezone.now()
+	ExchangeRate.objects.update_or_create(base=base, quote=quote, defaults={'rate': rate, 'fetched_at': fetched_at})
+	_cache_rate(base, quote, rate, fetched_at.timestamp())
+	return rate
+
+
+def _cache_rate(base, quote, rate, fetched_at):
+	# Kept well past RATE_TTL: a stale rate beats no rate while the upstream is down
+	cache.set(RATE_KEY.format(base, quote), (str(rate), fetched_at), RATE_TTL * 24)
+
+
+def _refresh_in_background(base, quote):
+	# One refresh per pair across all workers; the lock expires if a thread dies
+	if not cache.add(REFRESH_LOCK_KEY.format(base, quote), 1, FETCH_TIMEOUT * 10):
+		return
+
+	def run():
+		try:
+			refresh_rate(base, quote)
+		except RateUnavailable as e:
+			logger.warning("Exchange rate refresh for %s/%s failed: %s", base, quote, e)
+		finally:
+			cache.delete(REFRESH_LOCK_KEY.format(base, quote))
+			close_old_connections()
+
+	threading.Thread(target=run, name=f'fx-refresh-{base}{quote}', daemon=True).start()
+
+
+def refresh_due(fetched_at, now=None):
+	"""True once a rate fetched at fetched_at (a timestamp) is REFRESH_AHEAD of RATE_TTL old"""
+	now = time.time() if now is None else now
+	return now - fetched_at > RATE_TTL * REFRESH_AHEAD
+
+
+def get_rate(base='USD', quote='VND'):
+	"""
+	The current rate without network I/O: the cached rate, else the last one
+	saved in ExchangeRate, else FALLBACK_RATE. Once the rate is REFRESH_AHEAD
+	of RATE_TTL old a background refresh replaces it ahead of expiry. Only if
+	no refresh succeeds in that window (no traffic, upstream down) is a rate
+	older than RATE_TTL served, rather than none.
+	"""
+	cached = cache.get(RATE_KEY.format(base, quote))
+	if cached is not None:
+		rate, fetched_at = Decimal(cached[0]), cached[1]
+	else:
+		saved = ExchangeRate.objects.filter(base=base, quote=quote).first()
+		if saved is not None:
+			rate, fetched_at = saved.rate, saved.fetched_at.timestamp()
+			_cache_rate(base, quote, rate, fetched_at)
+		else:
+			rate, fetched_at = FALLBACK_RATE, 0
+
+	if refresh_due(fetched_at) and getattr(settings, 'EXCHANGE_RATE_BACKGROUND_REFRESH', True):
+		_refresh_in_background(base, quote)
+	return rate
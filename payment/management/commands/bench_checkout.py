@@ -0,0 +1,74 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from cart.cart import CartLine, CartSnapshot, unit_price
+from cart.pricing import price_snapshot
+from payment.models import ShippingAddress, Order, OrderItem
+from payment.reservations import reserve_order
+from payment.services import OrderService
+from store.models import Category, Product
+
+SHIPPING = {
+	'shipping_full_name': 'Bench Mark',
+	'shipping_email': 'bench@example.com',
+	'shipping_address1': '1 Load Street',
+	'shipping_city': 'Hanoi',
+	'shipping_zipcode': '100000',
+	'shipping_country': 'Vietnam',
+}
+
+
+class Command(BaseCommand):
+	help = "Benchmark order placement against cart size, row-by-row inserts versus OrderService; writes nothing"
+
+	def add_arguments(self, parser):
+		parser.add_argument('--sizes', type=int, nargs='+', default=[1, 5, 10, 20, 40, 80])
+		parser.add_argument('--repeat', type=int, default=20)
+
+	def handle(self, *args, **options):
+		with transaction.atomic():
+			user = get_user_model().objects.create_user(email='bench-checkout@example.com', password=None)
+			category = Category.objects.create(name='Checkout bench')
+			products = [
+				Product.objects.create(name=f'Bench item {number}', price=10 + number, stock=10 ** 6, category=category)
+				for number in range(max(options['sizes']))
+			]
+
+			self.stdout.write(f"{'lines':>6} {'row-by-row':>12} {'queries':>8} {'service':>10} {'queries':>8}")
+			for size in options['sizes']:
+				snapshot = CartSnapshot.from_lines(CartLine(product, 2, unit_price(product)) for product in products[:size])
+				prices = price_snapshot(snapshot)
+				row_ms, row_queries = self.measure(options['repeat'], lambda: self.place_row_by_row(user, snapshot, prices))
+				bulk_ms, bulk_queries = self.measure(
+					options['repeat'], lambda: OrderService(user, snapshot, prices).place(SHIPPING, 'vnpay')
+				)
+				self.stdout.write(f"{size:>6} {row_ms:>10.2f}ms {row_queries:>8} {bulk_ms:>8.2f}ms {bulk_queries:>8}")
+
+			transaction.set_rollback(True)
+
+	def measure(self, repeat, place):
+		timings = []
+		for _ in range(repeat):
+			with CaptureQueriesContext(connection) as queries:
+				started = time.perf_counter()
+				place()
+				timings.append(time.perf_counter() - started)
+		timings.sort()
+		return timings[len(timings) // 2] * 1000, len(queries)
+
+	def place_row_by_row(self, user, snapshot, prices):
+		"""What checkout_shipping did before OrderService, for comparison"""
+		shipping = ShippingAddress.objects.create(user=user, **SHIPPING)
+		order = Order.objects.create(
+			user=user,
+			shipping_address=shipping,
+			subtotal=prices.subtotal,
+			tax=prices.tax,
+			total=prices.total,
+			payment_method='vnpay',
+		)
+		for line in snapshot:
+			OrderItem.objects.create(order=order, product=line.product, quantity=line.quantity, price=line.unit_price)
+		reserve_order(order, {line.product.id: line.quantity for line in snapshot})
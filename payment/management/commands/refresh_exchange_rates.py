@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+from payment.exchange_rates import refresh_rate, RateUnavailable
+
+
+class Command(BaseCommand):
+	help = "Fetch the USD to VND rate and store it; run from cron so checkout always finds a fresh rate"
+
+	def handle(self, *args, **options):
+		try:
+			rate = refresh_rate('USD', 'VND')
+		except RateUnavailable as e:
+			raise CommandError(f"Exchange rate unavailable: {e}")
+		self.stdout.write(self.style.SUCCESS(f"1 USD = {rate} VND"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from payment.reservations import release_expired, SWEEP_BATCH_SIZE
+
+
+class Command(BaseCommand):
+	help = "Release stock held by unpaid orders whose reservation has expired; run every minute or so"
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE)
+
+	def handle(self, *args, **options):
+		count = release_expired(batch_size=options['batch_size'])
+		self.stdout.write(self.style.SUCCESS(f"Released {count} expired reservation(s)."))
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payment", "0006_exchangerate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="coupon",
+            name="counter_shards",
+            field=models.PositiveSmallIntegerField(
+                default=0,
+                help_text="Redemption counter rows for a heavily used coupon; 0 counts on the coupon row",
+            ),
+        ),
+        migrations.CreateModel(
+            name="CouponCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.PositiveSmallIntegerField()),
+                ("uses", models.PositiveIntegerField(default=0)),
+                (
+                    "coupon",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="counters",
+                        to="payment.coupon",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("coupon", "shard"), name="payment_couponcounter_shard"
+                    )
+                ],
+            },
+        ),
+    ]
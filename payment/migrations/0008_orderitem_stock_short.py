@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payment", "0007_coupon_counter_shards_couponcounter"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="orderitem",
+            name="stock_short",
+            field=models.BooleanField(default=False),
+        ),
+    ]
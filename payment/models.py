@@ -1,8 +1,11 @@
 from django.db import models
+from django.db.models import F, Q, Sum
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.core.validators import RegexValidator
 from django.core.validators import MinValueValidator, MaxValueValidator
+import random
 import uuid
 
 
@@ -107,6 +110,8 @@ class OrderItem(models.Model):
 	product = models.ForeignKey('store.Product', on_delete=models.SET_NULL, null=True)
 	quantity = models.PositiveIntegerField()
 	price = models.DecimalField(max_digits=10, decimal_places=2)  # price at time of purchase
+	# Set when the order was paid but stock could not cover this line; staff follow up
+	stock_short = models.BooleanField(default=False)
 
 	def __str__(self):
 		return f"{self.quantity} × {self.product.name if self.product else 'Deleted Product'}"
@@ -151,6 +156,11 @@ class Coupon(models.Model):
 	max_uses = models.PositiveIntegerField(null=True, blank=True, help_text="Total number of times this coupon can be used")
 	max_uses_per_user = models.PositiveIntegerField(null=True, blank=True, help_text="Maximum uses per user")
 	current_uses = models.PositiveIntegerField(default=0)
+	# Hot coupons spread redemptions over this many CouponCounter rows instead of current_uses
+	counter_shards = models.PositiveSmallIntegerField(
+		default=0,
+		help_text="Redemption counter rows for a heavily used coupon; 0 counts on the coupon row"
+	)
 	
 	# Date restrictions
 	valid_from = models.DateTimeField()
@@ -162,6 +172,10 @@ class Coupon(models.Model):
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 	
+	# Only redeem() writes these; full saves of an existing coupon leave them alone
+	COUNTER_FIELDS = ('current_uses',)
+	COUNTER_SHARDS_LOCKED = "The number of counter shards cannot change once they have counted uses."
+
 	class Meta:
 		ordering = ['-created_at']
 	
@@ -177,7 +191,7 @@ class Coupon(models.Model):
 			return False, "This coupon is not yet valid."
 		if now > self.valid_until:
 			return False, "This coupon has expired."
-		if self.max_uses and self.current_uses >= self.max_uses:
+		if self.max_uses and self.total_uses() >= self.max_uses:
 			return False, "This coupon has reached its usage limit."
 		return True, "Coupon is valid"
 	
@@ -192,6 +206,78 @@ class Coupon(models.Model):
 		return discount
 	
 
+	def total_uses(self):
+		"""current_uses plus what the counter shards hold"""
+		if not self.counter_shards:
+			return self.current_uses
+		return self.current_uses + (self.counters.aggregate(total=Sum('uses'))['total'] or 0)
+
+	def redeem(self):
+		"""
+		Count one use; returns False if max_uses is already reached. Each path is
+		a single conditional UPDATE, so concurrent checkouts cannot overshoot.
+		max_uses of None or 0 means unlimited, as in is_valid().
+		"""
+		if not self.counter_shards:
+			under_limit = Q(max_uses__isnull=True) | Q(max_uses=0) | Q(current_uses__lt=F('max_uses'))
+			return Coupon.objects.filter(under_limit, pk=self.pk).update(current_uses=F('current_uses') + 1) == 1
+
+		if self._redeem_on_shard():
+			return True
+		# Rows normally exist from save(); if they were missing (or another request was
+		# creating them meanwhile), make sure they exist and always try once more
+		self.create_counters()
+		return self._redeem_on_shard()
+
+	def create_counters(self):
+		CouponCounter.objects.bulk_create(
+			[CouponCounter(coupon=self, shard=shard) for shard in range(self.counter_shards)],
+			ignore_conflicts=True,
+		)
+
+	def shard_allowance(self, shard):
+		"""Uses shard may count: what was left of max_uses when sharding began, split evenly"""
+		remaining = max(self.max_uses - self.current_uses, 0)
+		return remaining // self.counter_shards + (1 if shard < remaining % self.counter_shards else 0)
+
+	def _counter_shards_locked(self):
+		# Allowances are split from current_uses when sharding begins; re-splitting
+		# after shards have counted uses would let max_uses be exceeded
+		if self._state.adding:
+			return False
+		saved = Coupon.objects.filter(pk=self.pk).values_list('counter_shards', flat=True).first()
+		return saved is not None and saved != self.counter_shards and self.counters.filter(uses__gt=0).exists()
+
+	def clean(self):
+		super().clean()
+		if self._counter_shards_locked():
+			raise ValidationError({'counter_shards': self.COUNTER_SHARDS_LOCKED})
+
+	def save(self, *args, **kwargs):
+		if self._counter_shards_locked():
+			raise ValidationError({'counter_shards': self.COUNTER_SHARDS_LOCKED})
+		if not self._state.adding and not kwargs.get('update_fields') and not kwargs.get('force_insert'):
+			# Usage counts only move through redeem(); a stale full save must not overwrite them
+			kwargs['update_fields'] = [
+				field.name for field in self._meta.concrete_fields
+				if not field.primary_key and field.name not in self.COUNTER_FIELDS
+			]
+		super().save(*args, **kwargs)
+		if self.counter_shards:
+			self.create_counters()
+
+	def _redeem_on_shard(self):
+		# Start on a random shard so concurrent checkouts update different rows
+		start = random.randrange(self.counter_shards)
+		for offset in range(self.counter_shards):
+			shard = (start + offset) % self.counter_shards
+			counter = CouponCounter.objects.filter(coupon=self, shard=shard)
+			if self.max_uses:
+				counter = counter.filter(uses__lt=self.shard_allowance(shard))
+			if counter.update(uses=F('uses') + 1):
+				return True
+		return False
+
 	#Check if user can still use this coupon
 	def can_be_used_by_user(self, user):
 		if not self.max_uses_per_user:
@@ -218,4 +304,59 @@ class CouponUsage(models.Model):
 		ordering = ['-used_at']
 	
 	def __str__(self):
-		return f"{self.user.username} used {self.coupon.code} on {self.order.order_number}"
\ No newline at end of file
+		return f"{self.user.username} used {self.coupon.code} on {self.order.order_number}"
+
+
+class CouponCounter(models.Model):
+	"""One of a hot coupon's redemption counters; Coupon.total_uses() sums them"""
+	coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='counters')
+	shard = models.PositiveSmallIntegerField()
+	uses = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['coupon', 'shard'], name='payment_couponcounter_shard'),
+		]
+
+	def __str__(self):
+		return f"{self.coupon.code} shard {self.shard}: {self.uses}"
+
+
+class StockReservation(models.Model):
+	"""
+	Units held for a pending order until it is paid, cancelled or expires.
+	Available stock is Product.stock minus the unexpired holds, summed over
+	the (product, expires_at) index.
+	"""
+	order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+	product = models.ForeignKey('store.Product', on_delete=models.CASCADE, related_name='reservations')
+	quantity = models.PositiveIntegerField()
+	created_at = models.DateTimeField(auto_now_add=True)
+	expires_at = models.DateTimeField()
+
+	class Meta:
+		indexes = [
+			# Active holds for a product: product_id = X AND expires_at > now
+			models.Index(fields=['product', 'expires_at'], name='payment_reservation_live_idx'),
+			# The sweeper walks expired holds oldest first
+			models.Index(fields=['expires_at'], name='payment_reservation_exp_idx'),
+		]
+
+	def __str__(self):
+		return f"{self.quantity} × {self.product_id} held for {self.order_id} until {self.expires_at:%H:%M}"
+
+
+class ExchangeRate(models.Model):
+	"""Last known good rate for a currency pair, so a cold cache never sends checkout to the network"""
+	base = models.CharField(max_length=3)
+	quote = models.CharField(max_length=3)
+	rate = models.DecimalField(max_digits=18, decimal_places=6)
+	fetched_at = models.DateTimeField()
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['base', 'quote'], name='payment_exchangerate_pair'),
+		]
+
+	def __str__(self):
+		return f"1 {self.base} = {self.rate} {self.quote} ({self.fetched_at:%Y-%m-%d %H:%M})"
@@ -0,0 +1,153 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+from store import facets
+from store.models import Product
+from .models import OrderItem, StockReservation
+
+logger = logging.getLogger(__name__)
+
+# How long checkout holds stock for an unpaid order
+RESERVATION_TTL = timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60))
+SWEEP_BATCH_SIZE = getattr(settings, 'STOCK_RESERVATION_SWEEP_BATCH_SIZE', 1000)
+
+
+class InsufficientStock(Exception):
+	def __init__(self, product, requested, available):
+		self.product = product
+		self.requested = requested
+		self.available = available
+		super().__init__(f"Only {available} of {product.name} available, {requested} requested")
+
+
+def reserved_quantities(product_ids, now=None):
+	"""{product_id: units held by unexpired reservations}, one indexed aggregate"""
+	now = now or timezone.now()
+	rows = (
+		StockReservation.objects
+		.filter(product_id__in=product_ids, expires_at__gt=now)
+		.values('product_id')
+		.annotate(held=Sum('quantity'))
+		.values_list('product_id', 'held')
+	)
+	return dict(rows)
+
+
+def available_quantities(product_ids):
+	"""{product_id: stock not held for a pending order}, for products that exist"""
+	held = reserved_quantities(product_ids)
+	return {
+		product_id: stock - held.get(product_id, 0)
+		for product_id, stock in Product.objects.filter(id__in=product_ids).values_list('id', 'stock')
+	}
+
+
+def available_stock(product):
+	return product.stock - reserved_quantities([product.id]).get(product.id, 0)
+
+
+def held_units(product_ref='pk'):
+	"""
+	Units of the outer query's product held by unexpired reservations, as a
+	correlated subquery, for checks that must run inside one statement.
+	"""
+	held = (
+		StockReservation.objects
+		.filter(product_id=OuterRef(product_ref), expires_at__gt=Now())
+		.values('product_id')
+		.annotate(held=Sum('quantity'))
+		.values('held')
+	)
+	return Coalesce(Subquery(held), 0, output_field=IntegerField())
+
+
+def reserve_order(order, quantities):
+	"""
+	Hold {product_id: quantity} for order until RESERVATION_TTL passes.
+	Raises InsufficientStock, holding nothing, if any line cannot be covered.
+
+	Product rows are locked in id order, so concurrent checkouts of the
+	same units queue up instead of both seeing the last one free.
+	"""
+	now = timezone.now()
+	with transaction.atomic():
+		products = list(Product.objects.select_for_update().filter(id__in=quantities).order_by('id'))
+		held = reserved_quantities([product.id for product in products], now)
+		for product in products:
+			available = product.stock - held.get(product.id, 0)
+			if quantities[product.id] > available:
+				raise InsufficientStock(product, quantities[product.id], max(available, 0))
+
+		StockReservation.objects.bulk_create([
+			StockReservation(
+				order=order,
+				product=product,
+				quantity=quantities[product.id],
+				expires_at=now + RESERVATION_TTL,
+			)
+			for product in products
+		])
+
+
+def deduct_stock(order):
+	"""
+	Take a paid order's quantities off Product.stock in one transaction, with
+	one conditional UPDATE per line in product id order. A line the stock
+	cannot cover is left alone, flagged stock_short and returned; the other
+	lines still apply.
+	"""
+	short = []
+	deducted = []
+	with transaction.atomic():
+		for item in order.items.filter(product__isnull=False).order_by('product_id'):
+			updated = (
+				Product.objects
+				.filter(id=item.product_id, stock__gte=item.quantity)
+				# seo_updated_at keys the cached product page, whose structured data shows availability
+				.update(stock=F('stock') - item.quantity, seo_updated_at=Now())
+			)
+			(deducted if updated else short).append(item)
+
+		if short:
+			OrderItem.objects.filter(pk__in=[item.pk for item in short]).update(stock_short=True)
+			for item in short:
+				item.stock_short = True
+
+		if deducted:
+			# update() skips Product's post_save. Refresh only these products' cards and
+			# facet counts rather than bumping the catalog version on every paid order.
+			# robust: the payment is committed by then, a failure here is logged, not raised
+			product_ids = [item.product_id for item in deducted]
+			transaction.on_commit(lambda: facets.refresh_cards(product_ids), robust=True)
+
+	for item in short:
+		logger.warning(
+			"Not enough stock for product %s on order %s: %s requested",
+			item.product_id, order.order_number, item.quantity
+		)
+	return short
+
+
+def release_order(order):
+	"""Drop the holds of an order that was paid, cancelled or abandoned"""
+	return StockReservation.objects.filter(order=order).delete()[0]
+
+
+def release_expired(batch_size=SWEEP_BATCH_SIZE, now=None):
+	"""Delete expired holds in batches of batch_size; returns how many were removed"""
+	now = now or timezone.now()
+	released = 0
+	while True:
+		ids = list(
+			StockReservation.objects
+			.filter(expires_at__lte=now)
+			.order_by('expires_at')
+			.values_list('id', flat=True)[:batch_size]
+		)
+		if not ids:
+			return released
+		released += StockReservation.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.utils import timezone
+from .models import ShippingAddress, Order, OrderItem, CouponUsage
+from .reservations import reserve_order, deduct_stock, release_order
+
+
+class CouponExhausted(Exception):
+	def __init__(self, coupon):
+		self.coupon = coupon
+		super().__init__(f"Coupon {coupon.code} has reached its usage limit")
+
+
+class OrderService:
+	"""
+	Places an order from a priced cart snapshot. Every row is built in memory
+	first and written in one transaction, so a failure leaves nothing behind:
+	shipping address, order, all items in one bulk insert, stock holds and
+	coupon usage.
+	"""
+	def __init__(self, user, snapshot, prices, coupon=None):
+		self.user = user
+		self.snapshot = snapshot
+		self.prices = prices
+		self.coupon = coupon
+
+	def build(self, shipping_fields, payment_method):
+		shipping = ShippingAddress(user=self.user, **shipping_fields)
+		order = Order(
+			user=self.user,
+			shipping_address=shipping,
+			subtotal=self.prices.subtotal,
+			discount_amount=self.prices.discount,
+			coupon=self.coupon,
+			tax=self.prices.tax,
+			total=self.prices.total,
+			status='pending',
+			payment_method=payment_method,
+		)
+		items = [
+			OrderItem(order=order, product=line.product, quantity=line.quantity, price=line.unit_price)
+			for line in self.snapshot
+		]
+		return shipping, order, items
+
+	def place(self, shipping_fields, payment_method):
+		"""
+		Write the order. Raises InsufficientStock or CouponExhausted, writing
+		nothing, if the cart cannot be covered or the coupon ran out meanwhile.
+		"""
+		shipping, order, items = self.build(shipping_fields, payment_method)
+		with transaction.atomic():
+			shipping.save()
+			order.save()
+			OrderItem.objects.bulk_create(items)
+
+			# Hold the units until payment comes back; rolls the order back if they are gone
+			reserve_order(order, {line.product.id: line.quantity for line in self.snapshot})
+
+			if self.coupon:
+				if not self.coupon.redeem():
+					raise CouponExhausted(self.coupon)
+				CouponUsage.objects.create(
+					coupon=self.coupon,
+					user=self.user,
+					order=order,
+					discount_amount=self.prices.discount,
+				)
+		return order
+
+
+def confirm_payment(order, transaction_id=None):
+	"""
+	Mark order paid, deduct its stock and drop its holds in one transaction.
+	Returns the items stock could not cover, or None if the order was
+	already paid: only one of several simultaneous confirmations applies.
+	"""
+	paid_at = timezone.now()
+	fields = {'status': 'paid', 'paid_at': paid_at}
+	if transaction_id:
+		fields['payment_transaction_id'] = transaction_id
+
+	with transaction.atomic():
+		if not Order.objects.filter(pk=order.pk).exclude(status='paid').update(**fields):
+			return None
+		short = deduct_stock(order)
+		release_order(order)
+
+	for field, value in fields.items():
+		setattr(order, field, value)
+	return short
@@ -1,3 +1,286 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from cart.cart import CartLine, CartSnapshot, unit_price
+from cart.pricing import price_snapshot
+from store.models import Category, Product
+from store.testing import LOCMEM_CACHES, run_in_threads
+from .exchange_rates import get_rate, refresh_due, refresh_rate, FALLBACK_RATE, RATE_TTL
+from .models import Coupon, ExchangeRate, Order, OrderItem, ShippingAddress
+from .reservations import InsufficientStock
+from .services import OrderService, confirm_payment
+from .utils import PayPalClient
 
-# Create your tests here.
+RATE_FIXTURE = Path(__file__).resolve().parent / 'sample_data' / 'exchange_rates_usd.json'
+
+
+@override_settings(
+	CACHES=LOCMEM_CACHES,
+	EXCHANGE_RATE_FETCHER='payment.exchange_rates.fetch_fixture_rates',
+	EXCHANGE_RATE_FIXTURE=str(RATE_FIXTURE),
+	EXCHANGE_RATE_BACKGROUND_REFRESH=False,
+)
+class ExchangeRateTests(TestCase):
+	def setUp(self):
+		cache.clear()
+
+	def test_refresh_persists_and_caches(self):
+		self.assertEqual(refresh_rate('USD', 'VND'), Decimal('26345.5'))
+		self.assertEqual(ExchangeRate.objects.get(base='USD', quote='VND').rate, Decimal('26345.5'))
+
+		with self.assertNumQueries(0):
+			self.assertEqual(get_rate('USD', 'VND'), Decimal('26345.5'))
+
+	def test_cold_cache_reads_last_saved_rate(self):
+		ExchangeRate.objects.create(
+			base='USD', quote='VND', rate=Decimal('25500'), fetched_at=timezone.now() - timedelta(days=2)
+		)
+
+		self.assertEqual(get_rate('USD', 'VND'), Decimal('25500'))
+
+	def test_fallback_before_any_fetch(self):
+		self.assertEqual(get_rate('USD', 'VND'), FALLBACK_RATE)
+
+	def test_refresh_starts_ahead_of_expiry(self):
+		self.assertFalse(refresh_due(0, now=RATE_TTL * 0.5))
+		self.assertTrue(refresh_due(0, now=RATE_TTL * 0.9))
+
+
+class OrderServiceTests(TestCase):
+	SHIPPING = {
+		'shipping_full_name': 'Ada Buyer',
+		'shipping_email': 'ada@example.com',
+		'shipping_address1': '1 Main Street',
+		'shipping_city': 'Hanoi',
+		'shipping_zipcode': '100000',
+		'shipping_country': 'Vietnam',
+	}
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(email='ada@example.com', password='secret')
+		category = Category.objects.create(name='Lamps')
+		self.products = [
+			Product.objects.create(name=f'Lamp {number}', price=10, stock=5, category=category)
+			for number in range(3)
+		]
+
+	def service(self, quantity):
+		snapshot = CartSnapshot.from_lines(CartLine(product, quantity, unit_price(product)) for product in self.products)
+		return OrderService(self.user, snapshot, price_snapshot(snapshot))
+
+	def test_items_are_inserted_together(self):
+		order = self.service(2).place(self.SHIPPING, 'vnpay')
+
+		self.assertEqual(order.items.count(), 3)
+		self.assertEqual(order.total, Decimal('66'))
+
+	def test_failed_reservation_writes_nothing(self):
+		with self.assertRaises(InsufficientStock):
+			self.service(6).place(self.SHIPPING, 'vnpay')
+
+		self.assertFalse(ShippingAddress.objects.exists())
+		self.assertFalse(Order.objects.exists())
+		self.assertFalse(OrderItem.objects.exists())
+
+
+class CouponRedemptionStressTests(TransactionTestCase):
+	"""Many checkouts redeeming one coupon at once must stop exactly at max_uses"""
+	THREADS = 8
+	REDEEMS_PER_THREAD = 5
+
+	def coupon(self, **fields):
+		now = timezone.now()
+		return Coupon.objects.create(
+			code='LAUNCH',
+			discount_value=Decimal('10'),
+			valid_from=now - timedelta(days=1),
+			valid_until=now + timedelta(days=1),
+			**fields
+		)
+
+	def run_parallel(self, coupon_id):
+		return run_in_threads(
+			lambda coupon: coupon.redeem(),
+			self.THREADS, repeat=self.REDEEMS_PER_THREAD, setup=lambda index: Coupon.objects.get(pk=coupon_id)
+		)
+
+	def test_limit_holds_on_the_coupon_row(self):
+		coupon = self.coupon(max_uses=17)
+
+		results = self.run_parallel(coupon.pk)
+
+		self.assertEqual(results.count(True), 17)
+		coupon.refresh_from_db()
+		self.assertEqual(coupon.total_uses(), 17)
+
+	def test_limit_holds_across_counter_shards(self):
+		coupon = self.coupon(max_uses=17, current_uses=3, counter_shards=4)
+
+		results = self.run_parallel(coupon.pk)
+
+		self.assertEqual(results.count(True), 14)
+		self.assertEqual(coupon.total_uses(), 17)
+
+	def test_zero_max_uses_is_unlimited(self):
+		coupon = self.coupon(max_uses=0)
+
+		self.assertTrue(coupon.is_valid()[0])
+		self.assertTrue(coupon.redeem())
+
+	def test_shard_count_is_fixed_once_shards_count_uses(self):
+		coupon = self.coupon(max_uses=10, counter_shards=2)
+		self.assertTrue(coupon.redeem())
+
+		coupon.counter_shards = 4
+		with self.assertRaises(ValidationError):
+			coupon.save()
+
+	def test_unlimited_coupon_counts_every_use(self):
+		coupon = self.coupon(counter_shards=4)
+
+		results = self.run_parallel(coupon.pk)
+
+		self.assertTrue(all(results))
+		self.assertEqual(coupon.total_uses(), self.THREADS * self.REDEEMS_PER_THREAD)
+
+
+class ConfirmPaymentConcurrencyTests(TransactionTestCase):
+	"""Simultaneous payment confirmations must deduct each order once and never drive stock negative"""
+	THREADS = 8
+
+	def setUp(self):
+		self.user = get_user_model().objects.create_user(email='payer@example.com', password='secret')
+		category = Category.objects.create(name='Flash Sale')
+		self.product = Product.objects.create(name='Lantern', price=20, stock=10, category=category)
+
+	def order(self, quantity):
+		order = Order.objects.create(user=self.user, subtotal=20 * quantity, total=20 * quantity)
+		OrderItem.objects.create(order=order, product=self.product, quantity=quantity, price=20)
+		return order
+
+	def run_parallel(self, orders):
+		# Post-commit hooks are robust, so a lock error can only come from the rolled back transaction
+		return run_in_threads(confirm_payment, len(orders), setup=orders.__getitem__)
+
+	def test_repeated_confirmations_deduct_once(self):
+		order = self.order(3)
+
+		results = self.run_parallel([Order.objects.get(pk=order.pk) for _ in range(self.THREADS)])
+
+		self.assertEqual(sum(result is not None for result in results), 1)
+		self.product.refresh_from_db()
+		self.assertEqual(self.product.stock, 7)
+
+	def test_competing_orders_stop_at_zero(self):
+		orders = [self.order(3) for _ in range(self.THREADS)]
+
+		results = self.run_parallel(orders)
+
+		self.assertEqual(sum(result == [] for result in results), 3)
+		self.product.refresh_from_db()
+		self.assertEqual(self.product.stock, 1)
+		# The paid orders stock could not cover keep a record of it
+		self.assertEqual(OrderItem.objects.filter(stock_short=True).count(), self.THREADS - 3)
+
+
+class PayPalStub(BaseHTTPRequestHandler):
+	"""Local stand-in for the PayPal REST API, keep-alive like the real one"""
+	protocol_version = 'HTTP/1.1'
+
+	def do_POST(self):
+		self.rfile.read(int(self.headers.get('Content-Length') or 0))
+		server = self.server
+		server.calls.append({
+			'path': self.path,
+			'port': self.client_address[1],
+			'request_id': self.headers.get('PayPal-Request-Id'),
+		})
+
+		if self.path == '/v1/oauth2/token':
+			server.tokens_issued += 1
+			self.reply(200, {'access_token': f'token-{server.tokens_issued}', 'expires_in': server.expires_in})
+		elif self.path.endswith('/capture') and server.failures:
+			server.failures -= 1
+			self.reply(503, {'name': 'SERVICE_UNAVAILABLE'})
+		elif self.path.endswith('/capture'):
+			self.reply(201, {'id': 'PAYPAL-1', 'status': 'COMPLETED'})
+		else:
+			self.reply(201, {'id': 'PAYPAL-1', 'status': 'CREATED'})
+
+	def reply(self, status, body):
+		data = json.dumps(body).encode()
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def log_message(self, format, *args):
+		pass
+
+
+class PayPalClientTests(SimpleTestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.server = ThreadingHTTPServer(('127.0.0.1', 0), PayPalStub)
+		threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.server.shutdown()
+		cls.server.server_close()
+		super().tearDownClass()
+
+	def setUp(self):
+		self.server.calls = []
+		self.server.tokens_issued = 0
+		self.server.expires_in = 3600
+		self.server.failures = 0
+		self.client = PayPalClient(
+			client_id='client',
+			client_secret='secret',
+			base_url=f'http://127.0.0.1:{self.server.server_address[1]}',
+			timeout=5,
+			backoff_factor=0,
+		)
+
+	def tearDown(self):
+		self.client.session.close()
+
+	def paths(self):
+		return [call['path'] for call in self.server.calls]
+
+	def test_token_and_connection_are_reused(self):
+		self.client.create_order(Decimal('10'), order_number='A')
+		self.client.create_order(Decimal('20'), order_number='B')
+		self.client.capture_order('PAYPAL-1')
+
+		self.assertEqual(self.paths().count('/v1/oauth2/token'), 1)
+		self.assertEqual(len({call['port'] for call in self.server.calls}), 1)
+
+	def test_token_is_refreshed_near_expiry(self):
+		self.server.expires_in = PayPalClient.TOKEN_EXPIRY_MARGIN - 1
+
+		self.client.create_order(Decimal('10'), order_number='A')
+		self.client.create_order(Decimal('20'), order_number='B')
+
+		self.assertEqual(self.paths().count('/v1/oauth2/token'), 2)
+
+	def test_unavailable_capture_is_retried_with_one_request_id(self):
+		self.server.failures = 2
+
+		result = self.client.capture_order('PAYPAL-1')
+
+		self.assertEqual(result['status'], 'COMPLETED')
+		captures = [call for call in self.server.calls if call['path'].endswith('/capture')]
+		self.assertEqual(len(captures), 3)
+		self.assertEqual(len({call['request_id'] for call in captures}), 1)
@@ -1,8 +1,12 @@
 import hmac
 import hashlib
+import threading
 import time
+import uuid
 import requests
+from requests.adapters import HTTPAdapter
 from urllib.parse import quote_plus
+from urllib3.util.retry import Retry
 from django.conf import settings
 
 class VNPay:
@@ -66,39 +70,98 @@ class VNPay:
 
 		return signed == vnp_securehash
 
+class PayPalError(Exception):
+	pass
+
+
 class PayPalClient:
 	"""
-	PayPal REST API helper for creating and capturing orders
+	PayPal REST API helper for creating and capturing orders.
+
+	Use get_paypal_client() rather than instantiating it per request: the
+	shared instance keeps its OAuth token until shortly before it expires and
+	reuses pooled keep-alive connections. Calls time out, and connection
+	errors and 429/5xx answers are retried with bounded backoff; order calls
+	send a PayPal-Request-Id so a retried POST is not applied twice.
 	"""
-	def __init__(self):
-		self.client_id = settings.PAYPAL_CLIENT_ID
-		self.client_secret = settings.PAYPAL_CLIENT_SECRET
+	# Refresh the token this many seconds before PayPal says it expires
+	TOKEN_EXPIRY_MARGIN = 60
+	RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+	def __init__(self, client_id=None, client_secret=None, base_url=None, timeout=None, max_retries=None, backoff_factor=None):
+		self.client_id = client_id or settings.PAYPAL_CLIENT_ID
+		self.client_secret = client_secret or settings.PAYPAL_CLIENT_SECRET
 		# Use sandbox for testing, live for production
-		self.base_url = settings.PAYPAL_MODE == 'live' and \
-			"https://api-m.paypal.com" or "https://api-m.sandbox.paypal.com"
+		self.base_url = base_url or (
+			settings.PAYPAL_MODE == 'live' and "https://api-m.paypal.com" or "https://api-m.sandbox.paypal.com"
+		)
+		# (connect, read) seconds
+		self.timeout = timeout or getattr(settings, 'PAYPAL_TIMEOUT', (3.05, 15))
 		self.access_token = None
+		self._token_expires_at = 0.0
+		self._token_lock = threading.Lock()
+
+		retry = Retry(
+			total=getattr(settings, 'PAYPAL_MAX_RETRIES', 2) if max_retries is None else max_retries,
+			backoff_factor=getattr(settings, 'PAYPAL_RETRY_BACKOFF', 0.5) if backoff_factor is None else backoff_factor,
+			status_forcelist=self.RETRY_STATUSES,
+			allowed_methods=frozenset({'GET', 'POST'}),
+			raise_on_status=False,
+		)
+		self.session = requests.Session()
+		self.session.mount('https://', HTTPAdapter(max_retries=retry))
+		self.session.mount('http://', HTTPAdapter(max_retries=retry))
 
 	def get_access_token(self):
-		"""Get OAuth 2.0 access token from PayPal"""
-		url = f"{self.base_url}/v1/oauth2/token"
-		headers = {
-			"Accept": "application/json",
-			"Accept-Language": "en_US",
-		}
-		data = {"grant_type": "client_credentials"}
-		
-		response = requests.post(
-			url,
-			headers=headers,
-			data=data,
-			auth=(self.client_id, self.client_secret)
-		)
-		
-		if response.status_code == 200:
-			self.access_token = response.json()['access_token']
+		"""OAuth 2.0 access token, fetched again only when close to expiry"""
+		with self._token_lock:
+			if self.access_token and time.monotonic() < self._token_expires_at:
+				return self.access_token
+
+			url = f"{self.base_url}/v1/oauth2/token"
+			headers = {
+				"Accept": "application/json",
+				"Accept-Language": "en_US",
+			}
+			data = {"grant_type": "client_credentials"}
+
+			response = self._send(
+				'POST', url,
+				headers=headers,
+				data=data,
+				auth=(self.client_id, self.client_secret)
+			)
+
+			if response.status_code != 200:
+				raise PayPalError(f"Failed to get access token: {response.text}")
+			body = response.json()
+			self.access_token = body['access_token']
+			self._token_expires_at = time.monotonic() + int(body.get('expires_in', 0)) - self.TOKEN_EXPIRY_MARGIN
 			return self.access_token
-		else:
-			raise Exception(f"Failed to get access token: {response.text}")
+
+	def _send(self, method, url, **kwargs):
+		try:
+			return self.session.request(method, url, timeout=self.timeout, **kwargs)
+		except requests.RequestException as e:
+			raise PayPalError(f"PayPal request failed: {e}") from e
+
+	def _api(self, method, path, expected_status, action, **kwargs):
+		"""Authorised API call; a token PayPal has revoked early is replaced once"""
+		headers = kwargs.pop('headers', {})
+		if method == 'POST':
+			headers.setdefault("PayPal-Request-Id", str(uuid.uuid4()))
+
+		for attempt in range(2):
+			headers["Authorization"] = f"Bearer {self.get_access_token()}"
+			response = self._send(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+			if response.status_code != 401 or attempt:
+				break
+			with self._token_lock:
+				self.access_token = None
+
+		if response.status_code != expected_status:
+			raise PayPalError(f"Failed to {action}: {response.text}")
+		return response.json()
 
 	def create_order(self, amount, currency='USD', order_number='', return_url='', cancel_url=''):
 		"""
@@ -111,15 +174,6 @@ class PayPalClient:
 			return_url: URL to redirect after successful payment
 			cancel_url: URL to redirect if payment is cancelled
 		"""
-		if not self.access_token:
-			self.get_access_token()
-
-		url = f"{self.base_url}/v2/checkout/orders"
-		headers = {
-			"Content-Type": "application/json",
-			"Authorization": f"Bearer {self.access_token}"
-		}
-		
 		# Convert Decimal to string with 2 decimal places
 		amount_str = f"{amount:.2f}"
 		
@@ -142,12 +196,7 @@ class PayPalClient:
 			}
 		}
 
-		response = requests.post(url, json=payload, headers=headers)
-		
-		if response.status_code == 201:
-			return response.json()
-		else:
-			raise Exception(f"Failed to create order: {response.text}")
+		return self._api('POST', "/v2/checkout/orders", 201, "create order", json=payload)
 
 	def capture_order(self, order_id):
 		"""
@@ -156,35 +205,25 @@ class PayPalClient:
 		Args:
 			order_id: PayPal order ID to capture
 		"""
-		if not self.access_token:
-			self.get_access_token()
-
-		url = f"{self.base_url}/v2/checkout/orders/{order_id}/capture"
-		headers = {
-			"Content-Type": "application/json",
-			"Authorization": f"Bearer {self.access_token}"
-		}
-
-		response = requests.post(url, headers=headers)
-		
-		if response.status_code == 201:
-			return response.json()
-		else:
-			raise Exception(f"Failed to capture order: {response.text}")
+		return self._api(
+			'POST', f"/v2/checkout/orders/{order_id}/capture", 201, "capture order",
+			headers={"Content-Type": "application/json"}
+		)
 
 	def get_order_details(self, order_id):
 		"""Get details of a PayPal order"""
-		if not self.access_token:
-			self.get_access_token()
+		return self._api('GET', f"/v2/checkout/orders/{order_id}", 200, "get order details")
 
-		url = f"{self.base_url}/v2/checkout/orders/{order_id}"
-		headers = {
-			"Authorization": f"Bearer {self.access_token}"
-		}
 
-		response = requests.get(url, headers=headers)
-		
-		if response.status_code == 200:
-			return response.json()
-		else:
-			raise Exception(f"Failed to get order details: {response.text}")
\ No newline at end of file
+_paypal_client = None
+_paypal_client_lock = threading.Lock()
+
+
+def get_paypal_client():
+	"""The process-wide PayPalClient, so the token and connections outlive a request"""
+	global _paypal_client
+	if _paypal_client is None:
+		with _paypal_client_lock:
+			if _paypal_client is None:
+				_paypal_client = PayPalClient()
+	return _paypal_client
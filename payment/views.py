@@ -1,15 +1,17 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.utils import timezone
 from django.urls import reverse
-from cart.cart import Cart, CartItem
-from .models import ShippingAddress, Order, OrderItem, Coupon, CouponUsage
+from cart.cart import Cart
+from cart.pricing import price
+from .models import Order, Coupon
 from store.models import Product, Address  
 from django.views.decorators.http import require_POST
-from .utils import VNPay, PayPalClient
+from .utils import VNPay, get_paypal_client
+from .reservations import release_order, InsufficientStock
+from .services import OrderService, CouponExhausted, confirm_payment
+from .exchange_rates import get_rate
 from decimal import Decimal
-import requests
 import json
 from django.http import JsonResponse
 
@@ -19,99 +21,67 @@ def payment_success(request):
 	return render(request, "payment/payment_success.html", {})
 
 
-def get_usd_to_vnd():
+def _applied_coupon(request):
+	"""The coupon saved in the session by apply_coupon, if it still exists"""
+	coupon_data = request.session.get('applied_coupon')
+	if not coupon_data:
+		return None
 	try:
-		response = requests.get('https://api.exchangerate-api.com/v4/latest/USD')
-		data = response.json()
-		return Decimal(str(data['rates']['VND']))
-	except Exception as e:
-		print(f"Error fetching exchange rate: {e}")
-		return Decimal("25000")
+		return Coupon.objects.get(code=coupon_data['code'])
+	except Coupon.DoesNotExist:
+		# Coupon no longer exists, remove from session
+		del request.session['applied_coupon']
+		return None
 
 
 @login_required
 def checkout_shipping(request):
 	cart = Cart(request)
-	if cart.__len__() == 0:
-		return redirect('cart:cart_summary')
+	snapshot = cart.snapshot()
+	if not snapshot:
+		return redirect('cart_summary')
 
-	# Calculate totals
-	subtotal = cart.get_total()
-	discount = Decimal('0.00')
-	applied_coupon = None
-	
-	# Check for applied coupon in session
-	coupon_data = request.session.get('applied_coupon')
-	if coupon_data:
-		try:
-			applied_coupon = Coupon.objects.get(code=coupon_data['code'])
-			discount = Decimal(coupon_data['discount'])
-		except Coupon.DoesNotExist:
-			# Coupon no longer exists, remove from session
-			del request.session['applied_coupon']
-			discount = Decimal('0.00')
-			applied_coupon = None
-	
-	# Calculate final amounts
-	discounted_subtotal = subtotal - discount
-	tax = discounted_subtotal * Decimal('0.1')
-	total = discounted_subtotal + tax
+	# Calculate totals; the discount follows the cart as it is now, not when the coupon was applied
+	applied_coupon = _applied_coupon(request)
+	prices = cart.price(applied_coupon)
+	subtotal, discount, tax, total = prices.subtotal, prices.discount, prices.tax, prices.total
 
 	# Get user's saved addresses
 	saved_addresses = Address.objects.filter(user=request.user)
 
 	if request.method == 'POST':
+		# A write-behind cart backend must have reached CartItem before the order is built
+		cart.flush()
+
 		# Get selected payment method
 		payment_method = request.POST.get('payment_method', 'vnpay')
 		
-		# Save shipping address
-		shipping = ShippingAddress.objects.create(
-			user=request.user,
-			shipping_full_name=request.POST['full_name'],
-			shipping_email=request.POST['email'],
-			shipping_phone=request.POST.get('phone', ''),
-			shipping_address1=request.POST['address1'],
-			shipping_address2=request.POST.get('address2', ''),
-			shipping_city=request.POST['city'],
-			shipping_state_province=request.POST.get('state', ''),
-			shipping_zipcode=request.POST['zipcode'],
-			shipping_country=request.POST['country'],
-		)
-
-		# Create order with coupon
-		order = Order.objects.create(
-			user=request.user,
-			shipping_address=shipping,
-			subtotal=subtotal,
-			discount_amount=discount,
-			coupon=applied_coupon,
-			tax=tax,
-			total=total,
-			status='pending',
-			payment_method=payment_method
-		)
-
-		for item in cart.get_prods():
-			quantity = getattr(item, 'cart_quantity', 1)
-			OrderItem.objects.create(
-				order=order,
-				product=item,
-				quantity=quantity,
-				price=item.sale_price if item.is_sale else item.price
-			)
-
-		# If coupon was used, increment usage count
-		if applied_coupon:
-			applied_coupon.current_uses += 1
-			applied_coupon.save()
-			
-			# Create usage record
-			CouponUsage.objects.create(
-				coupon=applied_coupon,
-				user=request.user,
-				order=order,
-				discount_amount=discount
-			)
+		# An abandoned earlier attempt from this session stops holding stock
+		previous_order = request.session.get('current_order_id')
+		if previous_order:
+			for stale in Order.objects.filter(order_number=previous_order, status='pending'):
+				release_order(stale)
+
+		shipping_fields = {
+			'shipping_full_name': request.POST['full_name'],
+			'shipping_email': request.POST['email'],
+			'shipping_phone': request.POST.get('phone', ''),
+			'shipping_address1': request.POST['address1'],
+			'shipping_address2': request.POST.get('address2', ''),
+			'shipping_city': request.POST['city'],
+			'shipping_state_province': request.POST.get('state', ''),
+			'shipping_zipcode': request.POST['zipcode'],
+			'shipping_country': request.POST['country'],
+		}
+		try:
+			order = OrderService(request.user, snapshot, prices, applied_coupon).place(shipping_fields, payment_method)
+		except InsufficientStock as e:
+			messages.error(request, f"Sorry, only {e.available} of {e.product.name} left. Please update your cart.")
+			return redirect('cart_summary')
+		except CouponExhausted as e:
+			del request.session['applied_coupon']
+			messages.error(request, f"Sorry, coupon {e.coupon.code} has just reached its usage limit.")
+			return redirect('payment:checkout_shipping')
 
 		# Save to session
 		request.session['current_order_id'] = str(order.order_number)
@@ -126,7 +96,8 @@ def checkout_shipping(request):
 		else:  # vnpay
 			vnp = VNPay()
 			total_usd = total
-			EXCHANGE_RATE = get_usd_to_vnd()
+			# Cached or last saved rate; checkout never waits on the rate provider
+			EXCHANGE_RATE = get_rate('USD', 'VND')
 			total_vnd = (total_usd * EXCHANGE_RATE).quantize(Decimal("1"))
 			amount_vnd = int(total_vnd)
 
@@ -143,7 +114,7 @@ def checkout_shipping(request):
 	return render(request, 'payment/checkout_shipping.html', {
 		"subtotal": subtotal,
 		"discount": discount,
-		"discounted_subtotal": discounted_subtotal,
+		"discounted_subtotal": prices.discounted_subtotal,
 		"tax": tax,
 		"total": total,
 		"saved_addresses": saved_addresses,
@@ -168,7 +139,7 @@ def paypal_create_order(request):
 	
 	# Create PayPal order
 	try:
-		paypal = PayPalClient()
+		paypal = get_paypal_client()
 		
 		# Build return URLs
 		return_url = request.build_absolute_uri(reverse('payment:paypal_return'))
@@ -222,56 +193,48 @@ def paypal_return(request):
 			})
 		
 		# Capture the payment
-		paypal = PayPalClient()
+		paypal = get_paypal_client()
 		capture_result = paypal.capture_order(paypal_order_id)
 		
 		# Check capture status
 		if capture_result['status'] == 'COMPLETED':
-			# Mark order as paid
-			order.status = "paid"
-			order.paid_at = timezone.now()
-			
 			# Get capture ID for reference
+			capture_id = None
 			if 'purchase_units' in capture_result:
 				capture_id = capture_result['purchase_units'][0]['payments']['captures'][0]['id']
-				order.payment_transaction_id = capture_id
 			
-			order.save()
-			
-			# Deduct stock
-			for order_item in order.items.all():
-				product = order_item.product
-				requested_qty = order_item.quantity
-				
-				if product.stock >= requested_qty:
-					product.stock -= requested_qty
-					product.save(update_fields=['stock'])
-				else:
-					print(f"WARNING: Not enough stock for {product.name}. Requested: {requested_qty}, Available: {product.stock}")
+			# Mark order as paid and deduct stock; a concurrent return may have done it already
+			short_items = confirm_payment(order, capture_id)
+			if short_items is None:
+				return render(request, "payment/paypal_return.html", {
+					"order": order,
+					"message": "Payment already processed!",
+					"success": True
+				})
 			
 			# Clear cart
-			cart = Cart(request)
-			if request.user.is_authenticated:
-				CartItem.objects.filter(user=request.user).delete()
-			else:
-				if "cart" in request.session:
-					del request.session["cart"]
-				if "session_key" in request.session:
-					request.session["session_key"] = {}
+			Cart(request).clear()
+			if "cart" in request.session:
+				del request.session["cart"]
 			
 			request.session.modified = True
 			
 			if "current_order_id" in request.session:
 				del request.session["current_order_id"]
 			
+			message = "Payment successful! Thank you for your purchase."
+			if short_items:
+				message += " Some items sold out before your payment arrived; we will contact you about them."
 			return render(request, "payment/paypal_return.html", {
 				"order": order,
-				"message": "Payment successful! Thank you for your purchase.",
+				"message": message,
+				"short_items": short_items,
 				"success": True
 			})
 		else:
 			order.status = "canceled"
 			order.save()
+			release_order(order)
 			return render(request, "payment/paypal_return.html", {
 				"order": order,
 				"message": f"Payment failed. Status: {capture_result['status']}",
@@ -297,6 +260,7 @@ def paypal_cancel(request):
 			order = Order.objects.get(order_number=order_number)
 			order.status = "canceled"
 			order.save()
+			release_order(order)
 		except Order.DoesNotExist:
 			pass
 	
@@ -329,8 +293,9 @@ def vnpay_return(request):
 
 	# 3. Handle payment result
 	if response_code == "00":
-		# --- ONLY PROCESS ONCE: Prevent double deduction ---
-		if order.status == "paid":
+		# --- 1. MARK PAID AND DEDUCT STOCK, ONLY ONCE ---
+		short_items = confirm_payment(order, params.get("vnp_TransactionNo"))
+		if short_items is None:
 			# Already processed → just show success (idempotent)
 			return render(request, "payment/vnpay_return.html", {
 				"order": order,
@@ -338,35 +303,10 @@ def vnpay_return(request):
 				"success": True
 			})
 
-		# Mark order as paid
-		order.status = "paid"
-		order.paid_at = timezone.now()
-		order.payment_transaction_id = params.get("vnp_TransactionNo")
-		order.save()
-
-		# --- 1. DEDUCT STOCK SAFELY ---
-		for order_item in order.items.all():
-			product = order_item.product
-			requested_qty = order_item.quantity
-
-			if product.stock >= requested_qty:
-				product.stock -= requested_qty
-				product.save(update_fields=['stock'])
-			else:
-				print(f"WARNING: Not enough stock for {product.name}. Requested: {requested_qty}, Available: {product.stock}")
-
 		# --- 2. CLEAR USER'S CART COMPLETELY ---
-		cart = Cart(request)
-
-		if request.user.is_authenticated:
-			CartItem.objects.filter(user=request.user).delete()
-		else:
-			# Delete from session
-			if "cart" in request.session:
-				del request.session["cart"]
-			# Also clear the custom session_key if exists
-			if "session_key" in request.session:
-				request.session["session_key"] = {}
+		Cart(request).clear()
+		if "cart" in request.session:
+			del request.session["cart"]
 		
 		request.session.modified = True
 
@@ -374,17 +314,22 @@ def vnpay_return(request):
 			del request.session["current_order_id"]
 
 		message = "Thanh toán thành công! Cảm ơn bạn đã mua hàng."
+		if short_items:
+			message += " Một số sản phẩm đã hết hàng trước khi thanh toán hoàn tất, chúng tôi sẽ liên hệ với bạn."
 		success = True
 
 	else:
 		order.status = "canceled"
 		order.save()
+		release_order(order)
 		message = f"Thanh toán thất bại (Mã lỗi: {response_code})"
+		short_items = []
 		success = False
 
 	return render(request, "payment/vnpay_return.html", {
 		"order": order,
 		"message": message,
+		"short_items": short_items,
 		"success": success
 	})
 
@@ -403,7 +348,8 @@ def apply_coupon(request):
 	try:
 		data = json.loads(request.body)
 		coupon_code = data.get('coupon_code', '').strip().upper()
-		subtotal = Decimal(str(data.get('subtotal', 0)))
+		# Priced from the cart itself rather than trusting the figure the page sent
+		subtotal = Cart(request).snapshot().subtotal
 		
 		if not coupon_code:
 			return JsonResponse({
@@ -444,15 +390,12 @@ def apply_coupon(request):
 			})
 		
 		# Calculate discount
-		discount = coupon.calculate_discount(subtotal)
-		new_subtotal = subtotal - discount
-		tax = new_subtotal * Decimal('0.1')
-		new_total = new_subtotal + tax
+		prices = price(subtotal, coupon)
 		
 		# Store coupon in session
 		request.session['applied_coupon'] = {
 			'code': coupon.code,
-			'discount': str(discount),
+			'discount': str(prices.discount),
 			'discount_type': coupon.discount_type,
 			'discount_value': str(coupon.discount_value)
 		}
@@ -460,10 +403,10 @@ def apply_coupon(request):
 		return JsonResponse({
 			'success': True,
 			'message': f'Coupon "{coupon.code}" applied successfully!',
-			'discount': float(discount),
-			'new_subtotal': float(new_subtotal),
-			'new_tax': float(tax),
-			'new_total': float(new_total),
+			'discount': float(prices.discount),
+			'new_subtotal': float(prices.discounted_subtotal),
+			'new_tax': float(prices.tax),
+			'new_total': float(prices.total),
 			'coupon_description': coupon.description
 		})
 		
@@ -479,11 +422,8 @@ def apply_coupon(request):
 def remove_coupon(request):
 	"""AJAX endpoint to remove applied coupon"""
 	try:
-		# Get original subtotal from cart
-		cart = Cart(request)
-		subtotal = cart.get_total()
-		tax = subtotal * Decimal('0.1')
-		total = subtotal + tax
+		# Get original totals from cart
+		prices = Cart(request).price()
 		
 		# Remove coupon from session
 		if 'applied_coupon' in request.session:
@@ -492,9 +432,9 @@ def remove_coupon(request):
 		return JsonResponse({
 			'success': True,
 			'message': 'Coupon removed.',
-			'subtotal': float(subtotal),
-			'tax': float(tax),
-			'total': float(total)
+			'subtotal': float(prices.subtotal),
+			'tax': float(prices.tax),
+			'total': float(prices.total)
 		})
 		
 	except Exception as e:
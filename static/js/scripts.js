@@ -30,6 +30,64 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+// Search-as-you-type suggestions for the navbar search box
+document.addEventListener('DOMContentLoaded', function() {
+    const input = document.querySelector('.search-form input[data-suggest-url]');
+    if (!input) {
+        return;
+    }
+
+    const menu = input.parentElement.querySelector('.search-suggestions');
+    let timer = null;
+    let lastQuery = '';
+
+    function hideSuggestions() {
+        menu.classList.remove('show');
+        menu.innerHTML = '';
+    }
+
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        const query = input.value.trim();
+        if (!query) {
+            hideSuggestions();
+            return;
+        }
+
+        timer = setTimeout(function() {
+            lastQuery = query;
+            fetch(`${input.dataset.suggestUrl}?q=${encodeURIComponent(query)}`)
+                .then(response => response.json())
+                .then(data => {
+                    // Drop answers to queries the user has already typed past
+                    if (data.query !== lastQuery) {
+                        return;
+                    }
+                    menu.innerHTML = '';
+                    data.suggestions.forEach(suggestion => {
+                        const item = document.createElement('li');
+                        const link = document.createElement('a');
+                        link.className = 'dropdown-item';
+                        link.href = suggestion.url;
+                        link.textContent = suggestion.label;
+                        if (suggestion.type === 'category') {
+                            link.textContent += ' (category)';
+                        }
+                        item.appendChild(link);
+                        menu.appendChild(item);
+                    });
+                    menu.classList.toggle('show', data.suggestions.length > 0);
+                })
+                .catch(error => console.error('Error loading suggestions:', error));
+        }, 120);
+    });
+
+    input.addEventListener('blur', function() {
+        // Let a click on a suggestion land before the menu disappears
+        setTimeout(hideSuggestions, 150);
+    });
+});
+
 // Change main image when clicking thumbnail
 function changeImage(thumbnail, imageSrc) {
     document.getElementById('mainImage').src = imageSrc;
@@ -64,36 +122,44 @@ function selectColor(colorSwatch, price) {
         productTitle.textContent = baseProductName + ' - ' + colorName;
     }
     
-    // Fetch images for the selected variant
-    fetch(`/get-images/${variantId}/`)
-        .then(response => response.json())
-        .then(data => {
-            const imageGallery = document.getElementById('image-gallery');
-            const mainImage = document.getElementById('mainImage');
-            
-            // Clear old thumbnails
-            imageGallery.innerHTML = '';
-            
-            // Add new thumbnails
-            data.images.forEach((url, index) => {
-                const thumbnailDiv = document.createElement('div');
-                thumbnailDiv.className = 'thumbnail' + (index === 0 ? ' active' : '');
-                thumbnailDiv.onclick = function() { changeImage(this, url); };
-                
-                const img = document.createElement('img');
-                img.src = url;
-                img.alt = 'Product thumbnail';
-                
-                thumbnailDiv.appendChild(img);
-                imageGallery.appendChild(thumbnailDiv);
-            });
-            
-            // Update main image to first image of new variant
-            if (data.images.length > 0) {
-                mainImage.src = data.images[0];
-            }
-        })
-        .catch(error => console.error('Error loading variant images:', error));
+    // Every variant's images are embedded in the page, so switching colour needs no request
+    const variant = getGalleryManifest().variants.find(v => String(v.id) === variantId);
+    const images = variant ? variant.images : [];
+    const imageGallery = document.getElementById('image-gallery');
+    const mainImage = document.getElementById('mainImage');
+    
+    // Clear old thumbnails
+    imageGallery.innerHTML = '';
+    
+    // Add new thumbnails
+    images.forEach((url, index) => {
+        const thumbnailDiv = document.createElement('div');
+        thumbnailDiv.className = 'thumbnail' + (index === 0 ? ' active' : '');
+        thumbnailDiv.onclick = function() { changeImage(this, url); };
+        
+        const img = document.createElement('img');
+        img.src = url;
+        img.alt = 'Product thumbnail';
+        
+        thumbnailDiv.appendChild(img);
+        imageGallery.appendChild(thumbnailDiv);
+    });
+    
+    // Update main image to first image of new variant
+    if (images.length > 0) {
+        mainImage.src = images[0];
+    }
+}
+
+// Gallery manifest written into the product page by json_script
+let galleryManifest = null;
+function getGalleryManifest() {
+    if (galleryManifest === null) {
+        const manifestScript = document.getElementById('gallery-manifest');
+        galleryManifest = manifestScript ? JSON.parse(manifestScript.textContent) : {};
+        galleryManifest.variants = galleryManifest.variants || [];
+    }
+    return galleryManifest;
 }
 
 function selectSize(sizeBtn, price) {
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
 
 
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        if getattr(settings, 'SEARCH_SUGGEST_WARM_ON_START', True):
+            # First request of each worker builds the suggest index off the request path
+            from .autocomplete import warm_suggest_index
+            request_started.connect(warm_suggest_index, dispatch_uid='store.warm_suggest_index')
@@ -0,0 +1,198 @@
+import heapq
+import logging
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import close_old_connections
+from django.db.models import Count
+from django.urls import reverse
+from .catalog import get_catalog_version
+from .models import Category, Product
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_LIMIT = getattr(settings, 'SEARCH_SUGGEST_LIMIT', 8)
+# How often a worker asks the cache whether the catalog changed
+VERSION_CHECK_INTERVAL = getattr(settings, 'SEARCH_SUGGEST_VERSION_CHECK_SECONDS', 5)
+# Block sizes of the precomputed top-N tables, smallest first
+BLOCK_SIZES = (64, 1024, 16384)
+
+
+def normalize(text):
+	text = unicodedata.normalize('NFKD', text.lower())
+	return ''.join(ch for ch in text if not unicodedata.combining(ch)).strip()
+
+
+class PrefixIndex:
+	"""
+	Sorted array of every word-start suffix of each entry label, searched
+	with bisect. "pro max" finds "iPhone 17 Pro Max" as well as "Pro Max Case".
+
+	A prefix maps to one contiguous slice of the array. To rank that slice
+	without walking it, the array is cut into aligned blocks of each size in
+	BLOCK_SIZES and the best top_n entries of every block are stored; a query
+	merges at most a few dozen of those lists plus the unaligned edges.
+
+	entries: dicts with at least 'label' and 'popularity'.
+	"""
+	def __init__(self, entries, top_n=SUGGEST_LIMIT):
+		self.entries = entries
+		self.top_n = top_n
+
+		# rank 0 is the most popular entry; ties keep catalog order
+		order = sorted(range(len(entries)), key=lambda entry_id: (-entries[entry_id]['popularity'], entry_id))
+		self.rank = [0] * len(entries)
+		for position, entry_id in enumerate(order):
+			self.rank[entry_id] = position
+
+		pairs = []
+		for entry_id, entry in enumerate(entries):
+			words = normalize(entry['label']).split()
+			for position in range(len(words)):
+				pairs.append((' '.join(words[position:]), entry_id))
+		pairs.sort()
+
+		self.keys = [key for key, _ in pairs]
+		self.entry_ids = [entry_id for _, entry_id in pairs]
+
+		self.block_tops = {}
+		previous_size, previous_tops = 1, [[entry_id] for entry_id in self.entry_ids]
+		for size in BLOCK_SIZES:
+			step = size // previous_size
+			tops = []
+			for start in range(0, len(previous_tops), step):
+				candidates = set()
+				for top in previous_tops[start:start + step]:
+					candidates.update(top)
+				tops.append(self._best(candidates, top_n))
+			self.block_tops[size] = tops
+			previous_size, previous_tops = size, tops
+
+	def __len__(self):
+		return len(self.entries)
+
+	def _best(self, entry_ids, limit):
+		return heapq.nsmallest(limit, entry_ids, key=self.rank.__getitem__)
+
+	def _candidates(self, low, high):
+		candidates = set()
+		position = low
+		while position < high:
+			for size in reversed(BLOCK_SIZES):
+				if position % size == 0 and position + size <= high:
+					candidates.update(self.block_tops[size][position // size])
+					position += size
+					break
+			else:
+				candidates.add(self.entry_ids[position])
+				position += 1
+		return candidates
+
+	def search(self, prefix, limit=None):
+		limit = min(limit or self.top_n, self.top_n)
+		prefix = ' '.join(normalize(prefix).split())
+		if not prefix:
+			return []
+
+		low = bisect_left(self.keys, prefix)
+		high = bisect_left(self.keys, prefix + '\uffff', low)
+		return [self.entries[entry_id] for entry_id in self._best(self._candidates(low, high), limit)]
+
+
+def build_entries():
+	"""Products ranked by how many shoppers favorited them, categories by catalog share"""
+	entries = []
+	products = Product.objects.annotate(popularity=Count('favorited_by')).values_list('name', 'slug', 'popularity')
+	for name, slug, popularity in products:
+		if slug:
+			entries.append({
+				'label': name,
+				'type': 'product',
+				'url': reverse('product', args=[slug]),
+				'popularity': popularity,
+			})
+
+	categories = Category.objects.annotate(popularity=Count('product')).values_list('name', 'slug', 'popularity')
+	for name, slug, popularity in categories:
+		entries.append({
+			'label': name,
+			'type': 'category',
+			'url': reverse('category', args=[slug]),
+			'popularity': popularity,
+		})
+	return entries
+
+
+class SuggestIndexHolder:
+	"""
+	Per-worker index. It is built in the background when the worker serves its
+	first request, and rebuilt in the background when the catalog version
+	moves. Requests keep using the previous index until the new one is swapped
+	in, so a suggest request never waits on a rebuild.
+	"""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._index = None
+		self._version = None
+		self._checked_at = 0.0
+		self._building = False
+
+	def get(self):
+		index = self._index
+		if index is None:
+			# Only if a request beats the warm-up: build once, other cold requests wait for it
+			with self._lock:
+				if self._index is None:
+					self._build()
+			return self._index
+
+		now = time.monotonic()
+		if now - self._checked_at >= VERSION_CHECK_INTERVAL:
+			self._checked_at = now
+			if get_catalog_version() != self._version:
+				self.refresh()
+		return index
+
+	def warm(self):
+		if self._index is None:
+			self.refresh()
+
+	def refresh(self):
+		"""Rebuild in a background thread, unless one is already running"""
+		with self._lock:
+			if self._building:
+				return
+			self._building = True
+		threading.Thread(target=self._rebuild, name='suggest-index-rebuild', daemon=True).start()
+
+	def _build(self):
+		# Version first: a change during the build is picked up by the next check
+		version = get_catalog_version()
+		index = PrefixIndex(build_entries())
+		self._version = version
+		self._index = index
+
+	def _rebuild(self):
+		try:
+			self._build()
+		except Exception:
+			logger.exception("Rebuilding the search-suggest index failed")
+		finally:
+			self._building = False
+			close_old_connections()
+
+
+suggest_index = SuggestIndexHolder()
+
+
+def warm_suggest_index(sender, **kwargs):
+	"""request_started receiver, connected in StoreConfig.ready(): warms the index once per worker"""
+	request_started.disconnect(warm_suggest_index, dispatch_uid='store.warm_suggest_index')
+	suggest_index.warm()
+
+
+def suggest(prefix, limit=SUGGEST_LIMIT):
+	return suggest_index.get().search(prefix, limit)
@@ -0,0 +1,68 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'store:catalog_version'
+CATEGORY_CACHE_TIMEOUT = getattr(settings, 'CATEGORY_CACHE_TIMEOUT', 600)
+
+CATEGORY_SORTS = {
+	'newest': ('-created_at', '-product_id'),
+	'price_low': ('effective_price', 'product_id'),
+	'price_high': ('-effective_price', 'product_id'),
+	'name': ('name', 'product_id'),
+}
+
+
+def get_catalog_version():
+	"""Counter bumped on every product or category write; caches key their entries on it"""
+	version = cache.get(CATALOG_VERSION_KEY)
+	if version is None:
+		# Seed from the clock so a counter lost to eviction never reuses an old value
+		cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), timeout=None)
+		version = cache.get(CATALOG_VERSION_KEY)
+	return version
+
+
+def bump_catalog_version():
+	try:
+		return cache.incr(CATALOG_VERSION_KEY)
+	except ValueError:
+		get_catalog_version()
+		return cache.incr(CATALOG_VERSION_KEY)
+
+
+class CategoryMap:
+	"""Per-worker slug -> Category map, reloaded when the catalog version moves"""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._by_slug = {}
+		self._version = None
+
+	def get(self, slug):
+		version = get_catalog_version()
+		if version != self._version:
+			from .models import Category
+			with self._lock:
+				if version != self._version:
+					self._by_slug = {category.slug: category for category in Category.objects.all()}
+					self._version = version
+		return self._by_slug.get(slug)
+
+
+category_map = CategoryMap()
+
+
+def category_product_ids(category, sort_by):
+	"""Ordered product ids of a category, cached until the next catalog write"""
+	from .models import ProductCard
+
+	key = f'catalog:category:{get_catalog_version()}:{category.pk}:{sort_by}'
+	product_ids = cache.get(key)
+	if product_ids is None:
+		ordering = CATEGORY_SORTS.get(sort_by, CATEGORY_SORTS['newest'])
+		product_ids = list(
+			ProductCard.objects.filter(category=category).order_by(*ordering).values_list('product_id', flat=True)
+		)
+		cache.set(key, product_ids, CATEGORY_CACHE_TIMEOUT)
+	return product_ids
@@ -0,0 +1,171 @@
+from bisect import bisect_right
+from collections import Counter
+from decimal import Decimal
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import FacetCount, Product, ProductCard
+
+# Lower bounds of the effective-price buckets; the last bucket is open ended
+PRICE_BUCKETS = [Decimal(str(edge)) for edge in getattr(settings, 'SEARCH_PRICE_BUCKETS', [0, 100, 500, 1000, 2000])]
+
+FACET_FIELDS = ('category_id', 'effective_price', 'is_sale', 'stock_band')
+
+
+def _bucket_key(index):
+	lower = PRICE_BUCKETS[index]
+	if index + 1 < len(PRICE_BUCKETS):
+		return f"{lower:g}-{PRICE_BUCKETS[index + 1]:g}"
+	return f"{lower:g}+"
+
+
+def price_bucket(price):
+	return _bucket_key(max(bisect_right(PRICE_BUCKETS, price) - 1, 0))
+
+
+def price_bucket_range(key):
+	"""(lower, upper) for a bucket key, upper is None for the open bucket; None if unknown"""
+	for index, lower in enumerate(PRICE_BUCKETS):
+		if _bucket_key(index) == key:
+			upper = PRICE_BUCKETS[index + 1] if index + 1 < len(PRICE_BUCKETS) else None
+			return lower, upper
+	return None
+
+
+def price_bucket_choices():
+	"""(key, label) pairs in ascending order for the search form"""
+	choices = []
+	for index, lower in enumerate(PRICE_BUCKETS):
+		if index + 1 < len(PRICE_BUCKETS):
+			label = f"${lower:g} - ${PRICE_BUCKETS[index + 1]:g}"
+		else:
+			label = f"${lower:g}+"
+		choices.append((_bucket_key(index), label))
+	return choices
+
+
+def facet_values(category_id, effective_price, is_sale, stock_band):
+	return [
+		('category', str(category_id)),
+		('price', price_bucket(effective_price)),
+		('sale', 'yes' if is_sale else 'no'),
+		('stock', 'no' if stock_band == 'out_of_stock' else 'yes'),
+	]
+
+
+def facet_keys(card):
+	"""Every (scope, facet, value) a card counts towards"""
+	values = facet_values(card.category_id, card.effective_price, card.is_sale, card.stock_band)
+	keys = []
+	for scope in ('', f'category:{card.category_id}'):
+		keys.extend((scope, facet, value) for facet, value in values)
+	return keys
+
+
+class _Row:
+	def __init__(self, values):
+		self.__dict__.update(values)
+
+
+def _keys_for(product_ids):
+	keys = Counter()
+	for row in ProductCard.objects.filter(product_id__in=product_ids).values(*FACET_FIELDS):
+		keys.update(facet_keys(_Row(row)))
+	return keys
+
+
+def apply_deltas(deltas):
+	for (scope, facet, value), delta in deltas.items():
+		if not delta:
+			continue
+		updated = FacetCount.objects.filter(scope=scope, facet=facet, value=value).update(count=F('count') + delta)
+		if not updated:
+			try:
+				with transaction.atomic():
+					FacetCount.objects.create(scope=scope, facet=facet, value=value, count=delta)
+			except IntegrityError:
+				# Another worker created the row first
+				FacetCount.objects.filter(scope=scope, facet=facet, value=value).update(count=F('count') + delta)
+
+
+def refresh_cards(product_ids):
+	"""Refresh ProductCard rows and move the facet counts by the difference"""
+	with transaction.atomic():
+		# Serialise refreshes of the same products: two concurrent ones would both read the
+		# same "before" and apply the same delta twice. The product row is locked rather than
+		# the card, which may not exist yet.
+		list(Product.objects.select_for_update().filter(id__in=product_ids).order_by('id').values_list('id', flat=True))
+		before = _keys_for(product_ids)
+		ProductCard.refresh(product_ids)
+		after = _keys_for(product_ids)
+
+		deltas = Counter(after)
+		deltas.subtract(before)
+		apply_deltas(deltas)
+
+
+def remove_product(product_id):
+	"""Take a product out of the counts before its card is cascade-deleted"""
+	deltas = Counter()
+	deltas.subtract(_keys_for([product_id]))
+	apply_deltas(deltas)
+
+
+def rebuild_facet_counts():
+	"""Recompute every count from scratch; only needed after bulk imports"""
+	counts = Counter()
+	for row in ProductCard.objects.values(*FACET_FIELDS).iterator():
+		counts.update(facet_keys(_Row(row)))
+
+	with transaction.atomic():
+		FacetCount.objects.all().delete()
+		FacetCount.objects.bulk_create([
+			FacetCount(scope=scope, facet=facet, value=value, count=count)
+			for (scope, facet, value), count in counts.items() if count
+		], batch_size=500)
+	return len(counts)
+
+
+def precomputed_facets(category_id=None):
+	"""
+	Counts for the whole catalog, or for one category, in one indexed lookup.
+	Category counts always come from the whole catalog so the other
+	categories stay visible; the rest are scoped to the selected category.
+	"""
+	scope = f'category:{category_id}' if category_id else ''
+	facets = {'category': {}, 'price': {}, 'sale': {}, 'stock': {}}
+	rows = FacetCount.objects.filter(scope__in={'', scope}, count__gt=0).values_list('scope', 'facet', 'value', 'count')
+	for row_scope, facet, value, count in rows:
+		if facet == 'category':
+			if row_scope == '':
+				facets[facet][value] = count
+		elif row_scope == scope:
+			facets[facet][value] = count
+	return facets
+
+
+def facets_for_cards(cards, category_id=None):
+	"""Same shape as precomputed_facets, counted over a result set such as a text query's matches"""
+	facets = {'category': Counter(), 'price': Counter(), 'sale': Counter(), 'stock': Counter()}
+	for row in cards.values(*FACET_FIELDS):
+		card = _Row(row)
+		for facet, value in facet_values(card.category_id, card.effective_price, card.is_sale, card.stock_band):
+			if facet == 'category' or not category_id or str(card.category_id) == str(category_id):
+				facets[facet][value] += 1
+	return {facet: dict(counts) for facet, counts in facets.items()}
+
+
+def filter_cards(cards, price=None, on_sale=False, in_stock=False):
+	"""Narrow a ProductCard queryset by the facet filters from the search form"""
+	if price:
+		bounds = price_bucket_range(price)
+		if bounds:
+			lower, upper = bounds
+			cards = cards.filter(effective_price__gte=lower)
+			if upper is not None:
+				cards = cards.filter(effective_price__lt=upper)
+	if on_sale:
+		cards = cards.filter(is_sale=True)
+	if in_stock:
+		cards = cards.exclude(stock_band='out_of_stock')
+	return cards
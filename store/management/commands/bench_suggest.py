@@ -0,0 +1,55 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from store.autocomplete import PrefixIndex
+
+WORDS = [
+	'iphone', 'pro', 'max', 'plus', 'mini', 'ipad', 'air', 'macbook', 'galaxy', 'ultra',
+	'dell', 'inspiron', 'xps', 'beats', 'studio', 'solo', 'headphone', 'earphone', 'case',
+	'charger', 'cable', 'black', 'white', 'blue', 'purple', 'gray', 'orange', 'laptop', 'tablet',
+]
+
+
+class Command(BaseCommand):
+	help = "Benchmark the search-suggest prefix index against a synthetic catalog"
+
+	def add_arguments(self, parser):
+		parser.add_argument('--products', type=int, default=100000)
+		parser.add_argument('--queries', type=int, default=20000)
+		parser.add_argument('--seed', type=int, default=42)
+
+	def handle(self, *args, **options):
+		rng = random.Random(options['seed'])
+		entries = [
+			{
+				'label': ' '.join(rng.choices(WORDS, k=rng.randint(2, 5))) + f' {number}',
+				'popularity': rng.randint(0, 5000),
+			}
+			for number in range(options['products'])
+		]
+
+		started = time.perf_counter()
+		index = PrefixIndex(entries)
+		build_seconds = time.perf_counter() - started
+
+		# Mix of what people actually type: one to a few letters, sometimes two words
+		queries = []
+		for _ in range(options['queries']):
+			text = ' '.join(rng.choices(WORDS, k=rng.randint(1, 2)))
+			queries.append(text[:rng.randint(1, len(text))])
+
+		timings = []
+		for query in queries:
+			started = time.perf_counter()
+			index.search(query)
+			timings.append(time.perf_counter() - started)
+		timings.sort()
+
+		def percentile(fraction):
+			return timings[min(int(len(timings) * fraction), len(timings) - 1)] * 1000
+
+		self.stdout.write(f"products: {len(index)}  keys: {len(index.keys)}  build: {build_seconds:.2f}s")
+		self.stdout.write(
+			f"queries: {len(timings)}  p50: {percentile(0.50):.3f}ms  "
+			f"p95: {percentile(0.95):.3f}ms  p99: {percentile(0.99):.3f}ms  max: {timings[-1] * 1000:.3f}ms"
+		)
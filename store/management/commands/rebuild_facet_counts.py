@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from store.facets import rebuild_facet_counts
+
+
+class Command(BaseCommand):
+	help = "Recompute the precomputed search facet counts from the product cards"
+
+	def handle(self, *args, **options):
+		count = rebuild_facet_counts()
+		self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} facet count(s)."))
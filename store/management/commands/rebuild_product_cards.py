@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from store.models import ProductCard
+
+
+class Command(BaseCommand):
+	help = "Rebuild the denormalised ProductCard rows used by listing pages"
+
+	def handle(self, *args, **options):
+		count = ProductCard.refresh()
+		self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} product card(s)."))
@@ -0,0 +1,16 @@
+import time
+from django.core.management.base import BaseCommand
+from store.search import get_search_backend
+
+
+class Command(BaseCommand):
+	help = "Rebuild the product full text search index from scratch"
+
+	def handle(self, *args, **options):
+		backend = get_search_backend()
+		started = time.perf_counter()
+		count = backend.rebuild()
+		elapsed = time.perf_counter() - started
+		self.stdout.write(self.style.SUCCESS(
+			f"Indexed {count} product(s) with {type(backend).__name__} in {elapsed:.2f}s."
+		))
@@ -0,0 +1,105 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_cards(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    ProductCard = apps.get_model("store", "ProductCard")
+
+    cards = []
+    for product in Product.objects.select_related("category").prefetch_related("variants__images"):
+        image_url = ""
+        variants = sorted(product.variants.all(), key=lambda v: v.pk)
+        if variants:
+            images = sorted(variants[0].images.all(), key=lambda i: i.pk)
+            if images:
+                image_url = images[0].image.url
+
+        if product.stock > 10:
+            stock_band = "in_stock"
+        elif product.stock > 0:
+            stock_band = "low_stock"
+        else:
+            stock_band = "out_of_stock"
+
+        cards.append(
+            ProductCard(
+                product=product,
+                name=product.name,
+                slug=product.slug,
+                price=product.price,
+                sale_price=product.sale_price,
+                effective_price=product.sale_price if product.is_sale else product.price,
+                is_sale=product.is_sale,
+                stock_band=stock_band,
+                category=product.category,
+                category_name=product.category.name,
+                image_url=image_url,
+                created_at=product.created_at,
+            )
+        )
+
+    ProductCard.objects.bulk_create(cards, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0044_product_store_product_feed_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductCard",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="card",
+                        serialize=False,
+                        to="store.product",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("slug", models.SlugField(blank=True, null=True)),
+                ("price", models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ("sale_price", models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ("effective_price", models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ("is_sale", models.BooleanField(default=False)),
+                (
+                    "stock_band",
+                    models.CharField(
+                        choices=[
+                            ("in_stock", "In Stock"),
+                            ("low_stock", "Low Stock"),
+                            ("out_of_stock", "Out of Stock"),
+                        ],
+                        default="out_of_stock",
+                        max_length=12,
+                    ),
+                ),
+                ("category_name", models.CharField(max_length=50)),
+                ("image_url", models.CharField(blank=True, max_length=500)),
+                ("created_at", models.DateTimeField()),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="cards",
+                        to="store.category",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["-created_at", "-product"], name="store_card_feed_idx"),
+                    models.Index(fields=["category", "-created_at"], name="store_card_category_idx"),
+                ],
+            },
+        ),
+        migrations.RunPython(populate_cards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:20
+
+import html
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE store_searchdocument_fts USING fts5(
+        name, body, category_name,
+        content='store_searchdocument', content_rowid='product_id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER store_searchdocument_ai AFTER INSERT ON store_searchdocument BEGIN
+        INSERT INTO store_searchdocument_fts(rowid, name, body, category_name)
+        VALUES (new.product_id, new.name, new.body, new.category_name);
+    END
+    """,
+    """
+    CREATE TRIGGER store_searchdocument_ad AFTER DELETE ON store_searchdocument BEGIN
+        INSERT INTO store_searchdocument_fts(store_searchdocument_fts, rowid, name, body, category_name)
+        VALUES ('delete', old.product_id, old.name, old.body, old.category_name);
+    END
+    """,
+    """
+    CREATE TRIGGER store_searchdocument_au AFTER UPDATE ON store_searchdocument BEGIN
+        INSERT INTO store_searchdocument_fts(store_searchdocument_fts, rowid, name, body, category_name)
+        VALUES ('delete', old.product_id, old.name, old.body, old.category_name);
+        INSERT INTO store_searchdocument_fts(rowid, name, body, category_name)
+        VALUES (new.product_id, new.name, new.body, new.category_name);
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS store_searchdocument_au",
+    "DROP TRIGGER IF EXISTS store_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS store_searchdocument_ai",
+    "DROP TABLE IF EXISTS store_searchdocument_fts",
+]
+
+MYSQL_FORWARD = [
+    "ALTER TABLE store_searchdocument ADD FULLTEXT INDEX store_searchdocument_ft (name, body, category_name)",
+]
+
+MYSQL_BACKWARD = [
+    "ALTER TABLE store_searchdocument DROP INDEX store_searchdocument_ft",
+]
+
+
+def create_text_index(apps, schema_editor):
+    statements = {
+        "sqlite": SQLITE_FORWARD,
+        "mysql": MYSQL_FORWARD,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_text_index(apps, schema_editor):
+    statements = {
+        "sqlite": SQLITE_BACKWARD,
+        "mysql": MYSQL_BACKWARD,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def populate_documents(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    SearchDocument = apps.get_model("store", "SearchDocument")
+
+    documents = []
+    for product in Product.objects.select_related("category"):
+        body = html.unescape(strip_tags(product.description)) if product.description else ""
+        documents.append(
+            SearchDocument(
+                product=product,
+                name=product.name,
+                body=" ".join(body.split()),
+                category_name=product.category.name,
+            )
+        )
+    SearchDocument.objects.bulk_create(documents, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0045_productcard"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchDocument",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="store.product",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("body", models.TextField(blank=True)),
+                ("category_name", models.CharField(max_length=50)),
+            ],
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+        migrations.RunPython(populate_documents, migrations.RunPython.noop),
+    ]
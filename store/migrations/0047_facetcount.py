@@ -0,0 +1,90 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:41
+
+from bisect import bisect_right
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of the facet key logic in store/facets.py as it stood when
+# FacetCount was added, so later edits there cannot change this migration.
+PRICE_BUCKETS = [
+    Decimal(str(edge))
+    for edge in getattr(settings, "SEARCH_PRICE_BUCKETS", [0, 100, 500, 1000, 2000])
+]
+
+
+def price_bucket(price):
+    index = max(bisect_right(PRICE_BUCKETS, price) - 1, 0)
+    lower = PRICE_BUCKETS[index]
+    if index + 1 < len(PRICE_BUCKETS):
+        return f"{lower:g}-{PRICE_BUCKETS[index + 1]:g}"
+    return f"{lower:g}+"
+
+
+def facet_keys(card):
+    values = [
+        ("category", str(card.category_id)),
+        ("price", price_bucket(card.effective_price)),
+        ("sale", "yes" if card.is_sale else "no"),
+        ("stock", "no" if card.stock_band == "out_of_stock" else "yes"),
+    ]
+    keys = []
+    for scope in ("", f"category:{card.category_id}"):
+        keys.extend((scope, facet, value) for facet, value in values)
+    return keys
+
+
+def populate_counts(apps, schema_editor):
+    ProductCard = apps.get_model("store", "ProductCard")
+    FacetCount = apps.get_model("store", "FacetCount")
+
+    counts = Counter()
+    for card in ProductCard.objects.all():
+        counts.update(facet_keys(card))
+
+    FacetCount.objects.bulk_create(
+        [
+            FacetCount(scope=scope, facet=facet, value=value, count=count)
+            for (scope, facet, value), count in counts.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0046_searchdocument"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FacetCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("scope", models.CharField(blank=True, max_length=30)),
+                ("facet", models.CharField(max_length=20)),
+                ("value", models.CharField(max_length=30)),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("scope", "facet", "value"),
+                        name="store_facetcount_unique",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:05
+
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def populate_slugs(apps, schema_editor):
+    Category = apps.get_model("store", "Category")
+    taken = set()
+    for category in Category.objects.order_by("id"):
+        base = slugify(category.name) or f"category-{category.id}"
+        slug = base
+        suffix = 2
+        while slug in taken:
+            slug = f"{base}-{suffix}"
+            suffix += 1
+        taken.add(slug)
+        category.slug = slug
+        category.save(update_fields=["slug"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0047_facetcount"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="slug",
+            field=models.SlugField(blank=True, max_length=60, null=True),
+        ),
+        migrations.RunPython(populate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="category",
+            name="slug",
+            field=models.SlugField(blank=True, max_length=60, unique=True),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counts(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    Comment = apps.get_model("store", "Comment")
+    Reply = apps.get_model("store", "Reply")
+
+    comment_counts = (
+        Comment.objects.filter(product=OuterRef("pk"))
+        .order_by()
+        .values("product")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    Product.objects.update(comment_count=Coalesce(Subquery(comment_counts), 0))
+
+    reply_counts = (
+        Reply.objects.filter(parent_comment=OuterRef("pk"))
+        .order_by()
+        .values("parent_comment")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    Comment.objects.update(reply_count=Coalesce(Subquery(reply_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0048_category_slug"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="comment_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="reply_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["product", "-date_added", "-id"], name="store_comment_page_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reply",
+            index=models.Index(
+                fields=["parent_comment", "-date_added", "-id"], name="store_reply_page_idx"
+            ),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+def build_gallery_manifest(variants):
+    # Frozen copy of Product.build_gallery_manifest as it stood in this migration
+    return {
+        "variants": [
+            {
+                "id": variant.id,
+                "color_name": variant.color_name,
+                "color_code": variant.color_code or "",
+                "extra_price": str(variant.extra_price),
+                "images": [image.image.url for image in variant.images.all()],
+            }
+            for variant in variants
+        ]
+    }
+
+
+def populate_manifests(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    ProductVariant = apps.get_model("store", "ProductVariant")
+
+    variants = {}
+    for variant in ProductVariant.objects.prefetch_related("images").order_by("id"):
+        variants.setdefault(variant.product_id, []).append(variant)
+
+    for product_id, product_variants in variants.items():
+        Product.objects.filter(pk=product_id).update(
+            gallery_manifest=build_gallery_manifest(product_variants)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0049_comment_counts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="gallery_manifest",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(populate_manifests, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:40
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    CartItem = apps.get_model("store", "CartItem")
+
+    duplicates = (
+        CartItem.objects.values("user", "product")
+        .order_by()
+        .annotate(rows=Count("id"), keep=Min("id"), total=Sum("quantity"))
+        .filter(rows__gt=1)
+    )
+    for row in duplicates:
+        CartItem.objects.filter(pk=row["keep"]).update(quantity=row["total"])
+        CartItem.objects.filter(user=row["user"], product=row["product"]).exclude(pk=row["keep"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0050_product_gallery_manifest"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="cartitem",
+            constraint=models.UniqueConstraint(
+                fields=("user", "product"), name="store_cartitem_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0051_cartitem_unique"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="product",
+            name="store_product_feed_idx",
+        ),
+    ]
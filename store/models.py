@@ -15,6 +15,22 @@ import uuid
 
 class Category(models.Model):
 	name = models.CharField(max_length=50)
+	slug = models.SlugField(max_length=60, unique=True, blank=True)
+
+	def save(self, *args, **kwargs):
+		# Auto-generate slug if not exists, de-duplicated the same way as migration 0048
+		if not self.slug:
+			self.slug = self.unique_slug()
+		super().save(*args, **kwargs)
+
+	def unique_slug(self):
+		base = slugify(self.name) or (f'category-{self.pk}' if self.pk else 'category')
+		slug = base
+		suffix = 2
+		while Category.objects.filter(slug=slug).exclude(pk=self.pk).exists():
+			slug = f'{base}-{suffix}'
+			suffix += 1
+		return slug
 
 	def __str__(self):
 		return self.name
@@ -93,12 +109,19 @@ class Product(models.Model):
 	sale_price = models.DecimalField(default=0, decimal_places=2, max_digits=8)
 	stock = models.PositiveIntegerField(default=0)
 	created_at = models.DateTimeField(auto_now_add=True)
+	# Maintained by the comment signal handlers so pages never COUNT(*) comments
+	comment_count = models.PositiveIntegerField(default=0, editable=False)
+	# Every variant's colour, extra price and image URLs, rebuilt by the variant/image signal handlers
+	gallery_manifest = models.JSONField(default=dict, blank=True, editable=False)
 
 	#SEO columns
 	meta_title = models.CharField(max_length=150, blank=True, null=True)
 	meta_description = models.CharField(max_length=300, blank=True, null=True)
 	seo_updated_at = models.DateTimeField(auto_now=True)
 
+	# Columns owned by signal handlers; a full save of a stale instance must not write them back
+	DERIVED_FIELDS = ('comment_count', 'gallery_manifest')
+
 	def get_meta_title(self):
 		"""Returns meta title or generates one"""
 		if self.meta_title:
@@ -124,8 +147,47 @@ class Product(models.Model):
 		if not self.slug:
 			from django.utils.text import slugify
 			self.slug = slugify(self.name)
+		if not self._state.adding and not kwargs.get('update_fields') and not kwargs.get('force_insert'):
+			kwargs['update_fields'] = [
+				field.name for field in self._meta.concrete_fields
+				if not field.primary_key and field.name not in self.DERIVED_FIELDS
+			]
+		elif kwargs.get('update_fields') and 'seo_updated_at' not in kwargs['update_fields']:
+			# Partial saves such as stock changes still move the key of the cached page fragments
+			kwargs['update_fields'] = [*kwargs['update_fields'], 'seo_updated_at']
 		super().save(*args, **kwargs)
 
+	@staticmethod
+	def build_gallery_manifest(variants):
+		"""What the colour picker needs, from variants with their images prefetched"""
+		return {
+			'variants': [
+				{
+					'id': variant.id,
+					'color_name': variant.color_name,
+					'color_code': variant.color_code or '',
+					'extra_price': str(variant.extra_price),
+					'images': [image.image.url for image in variant.images.all()],
+				}
+				for variant in variants
+			]
+		}
+
+	@classmethod
+	def refresh_gallery_manifest(cls, product_ids):
+		"""Rebuild the stored manifests; also moves seo_updated_at so cached fragments roll over"""
+		product_ids = set(product_ids)
+		variants = {product_id: [] for product_id in product_ids}
+		for variant in ProductVariant.objects.filter(product_id__in=product_ids).prefetch_related('images').order_by('id'):
+			variants[variant.product_id].append(variant)
+
+		now = timezone.now()
+		for product_id, product_variants in variants.items():
+			cls.objects.filter(pk=product_id).update(
+				gallery_manifest=cls.build_gallery_manifest(product_variants),
+				seo_updated_at=now
+			)
+
 	def __str__(self):
 		return self.name
 
@@ -148,6 +210,172 @@ class ProductImage(models.Model):
 		return f"Image for {self.variant.product.name} ({self.variant.color_name})"
 
 
+class ProductCard(models.Model):
+	"""
+	Denormalised row per product holding everything a listing card shows,
+	so home, category and search pages render from a single query.
+	Kept current by the handlers in store/signals.py.
+	"""
+	STOCK_BANDS = (
+		('in_stock', 'In Stock'),
+		('low_stock', 'Low Stock'),
+		('out_of_stock', 'Out of Stock'),
+	)
+	LOW_STOCK_THRESHOLD = 10
+
+	product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='card')
+	name = models.CharField(max_length=100)
+	slug = models.SlugField(blank=True, null=True)
+	price = models.DecimalField(default=0, decimal_places=2, max_digits=8)
+	sale_price = models.DecimalField(default=0, decimal_places=2, max_digits=8)
+	effective_price = models.DecimalField(default=0, decimal_places=2, max_digits=8)
+	is_sale = models.BooleanField(default=False)
+	stock_band = models.CharField(max_length=12, choices=STOCK_BANDS, default='out_of_stock')
+	category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='cards')
+	category_name = models.CharField(max_length=50)
+	image_url = models.CharField(max_length=500, blank=True)
+	created_at = models.DateTimeField()
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['-created_at', '-product'], name='store_card_feed_idx'),
+			models.Index(fields=['category', '-created_at'], name='store_card_category_idx'),
+		]
+
+	def __str__(self):
+		return self.name
+
+	@classmethod
+	def stock_band_for(cls, stock):
+		if stock > cls.LOW_STOCK_THRESHOLD:
+			return 'in_stock'
+		if stock > 0:
+			return 'low_stock'
+		return 'out_of_stock'
+
+	@classmethod
+	def from_product(cls, product):
+		"""Build an unsaved card; expects category and variants__images to be loaded"""
+		image_url = ''
+		variants = sorted(product.variants.all(), key=lambda v: v.pk)
+		if variants:
+			images = sorted(variants[0].images.all(), key=lambda i: i.pk)
+			if images:
+				image_url = images[0].image.url
+
+		return cls(
+			product=product,
+			name=product.name,
+			slug=product.slug,
+			price=product.price,
+			sale_price=product.sale_price,
+			effective_price=product.sale_price if product.is_sale else product.price,
+			is_sale=product.is_sale,
+			stock_band=cls.stock_band_for(product.stock),
+			category=product.category,
+			category_name=product.category.name,
+			image_url=image_url,
+			created_at=product.created_at,
+		)
+
+	@classmethod
+	def refresh(cls, product_ids=None):
+		"""Rebuild the cards for product_ids (all products when None)"""
+		products = Product.objects.select_related('category').prefetch_related('variants__images')
+		if product_ids is not None:
+			product_ids = set(product_ids)
+			products = products.filter(id__in=product_ids)
+
+		cards = [cls.from_product(product) for product in products]
+		if cards:
+			cls.objects.bulk_create(
+				cards,
+				update_conflicts=True,
+				unique_fields=['product'],
+				update_fields=[
+					'name', 'slug', 'price', 'sale_price', 'effective_price', 'is_sale',
+					'stock_band', 'category', 'category_name', 'image_url', 'created_at',
+				],
+			)
+
+		if product_ids is not None:
+			missing = product_ids - {card.product_id for card in cards}
+			if missing:
+				cls.objects.filter(product_id__in=missing).delete()
+		return len(cards)
+
+
+
+
+class FacetCount(models.Model):
+	"""
+	Precomputed number of products per facet value, maintained by deltas in
+	store/facets.py. scope is '' for the whole catalog or 'category:<id>'.
+	"""
+	scope = models.CharField(max_length=30, blank=True)
+	facet = models.CharField(max_length=20)
+	value = models.CharField(max_length=30)
+	count = models.IntegerField(default=0)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['scope', 'facet', 'value'], name='store_facetcount_unique'),
+		]
+
+	def __str__(self):
+		return f"{self.scope or 'all'} {self.facet}={self.value}: {self.count}"
+
+
+class SearchDocument(models.Model):
+	"""
+	Plain-text copy of the searchable product fields. The database indexes
+	this table: an FTS5 shadow table on SQLite, a FULLTEXT index on MySQL
+	(see store/search.py and migration 0046).
+	"""
+	product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+	name = models.CharField(max_length=100)
+	body = models.TextField(blank=True)
+	category_name = models.CharField(max_length=50)
+
+	def __str__(self):
+		return self.name
+
+	@classmethod
+	def from_product(cls, product):
+		from django.utils.html import strip_tags
+		import html
+		body = html.unescape(strip_tags(product.description)) if product.description else ''
+		return cls(
+			product=product,
+			name=product.name,
+			body=' '.join(body.split()),
+			category_name=product.category.name,
+		)
+
+	@classmethod
+	def refresh(cls, product_ids=None):
+		"""Rebuild the documents for product_ids (all products when None)"""
+		products = Product.objects.select_related('category')
+		if product_ids is not None:
+			product_ids = set(product_ids)
+			products = products.filter(id__in=product_ids)
+
+		documents = [cls.from_product(product) for product in products]
+		if documents:
+			cls.objects.bulk_create(
+				documents,
+				batch_size=500,
+				update_conflicts=True,
+				unique_fields=['product'],
+				update_fields=['name', 'body', 'category_name'],
+			)
+
+		if product_ids is not None:
+			missing = product_ids - {document.product_id for document in documents}
+			if missing:
+				cls.objects.filter(product_id__in=missing).delete()
+		return len(documents)
+
 
 
 User = get_user_model()
@@ -196,6 +424,12 @@ class CartItem(models.Model):
 	quantity = models.PositiveIntegerField(default=1)
 	added_at = models.DateTimeField(auto_now_add=True)
 
+	class Meta:
+		constraints = [
+			# One line per product; merging and upserts add to its quantity
+			models.UniqueConstraint(fields=['user', 'product'], name='store_cartitem_unique'),
+		]
+
 	def __str__(self):
 		return f"{self.product.name} x {self.quantity}"
 
@@ -239,9 +473,24 @@ class Comment(models.Model):
 	#name = models.CharField(max_length=255)
 	body = models.TextField()
 	date_added = models.DateTimeField(auto_now_add=True)
+	reply_count = models.PositiveIntegerField(default=0, editable=False)
+
+	# Maintained by the reply signal handlers; a full save of a stale instance must not write it back
+	DERIVED_FIELDS = ('reply_count',)
 
 	class Meta:
 		ordering = ['-date_added']
+		indexes = [
+			models.Index(fields=['product', '-date_added', '-id'], name='store_comment_page_idx'),
+		]
+
+	def save(self, *args, **kwargs):
+		if not self._state.adding and not kwargs.get('update_fields') and not kwargs.get('force_insert'):
+			kwargs['update_fields'] = [
+				field.name for field in self._meta.concrete_fields
+				if not field.primary_key and field.name not in self.DERIVED_FIELDS
+			]
+		super().save(*args, **kwargs)
 
 	def __str__(self):
 		author_name = self.author.get_display_name() if self.author else "Anonymous"
@@ -256,6 +505,9 @@ class Reply(models.Model):
 
 	class Meta:
 		ordering = ['-date_added']
+		indexes = [
+			models.Index(fields=['parent_comment', '-date_added', '-id'], name='store_reply_page_idx'),
+		]
 
 	def __str__(self):
 		author_name = self.author.get_display_name() if self.author else "Anonymous"
@@ -0,0 +1,57 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+	pass
+
+
+def encode_cursor(position, pk):
+	"""Pack an (ordering value, id) pair into an opaque URL-safe token"""
+	if isinstance(position, datetime):
+		position = position.isoformat()
+	raw = json.dumps([position, pk], separators=(',', ':')).encode('utf-8')
+	return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, is_datetime=True):
+	"""Unpack a token built by encode_cursor, raising InvalidCursor on garbage"""
+	try:
+		padded = cursor + '=' * (-len(cursor) % 4)
+		position, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+		if is_datetime:
+			position = datetime.fromisoformat(position)
+		return position, int(pk)
+	except (ValueError, TypeError, UnicodeError):
+		raise InvalidCursor(cursor)
+
+
+def keyset_page(queryset, cursor=None, page_size=24, order_field='created_at', pk_field='id'):
+	"""
+	Return one page of a queryset ordered newest first on (order_field, pk_field).
+
+	Rows inserted while a visitor scrolls always sort before the cursor,
+	so later pages never repeat or skip anything.
+
+	Returns (items, next_cursor); next_cursor is None on the last page.
+	"""
+	queryset = queryset.order_by(f'-{order_field}', f'-{pk_field}')
+
+	if cursor:
+		position, pk = decode_cursor(cursor)
+		queryset = queryset.filter(
+			Q(**{f'{order_field}__lt': position}) |
+			Q(**{order_field: position, f'{pk_field}__lt': pk})
+		)
+
+	items = list(queryset[:page_size + 1])
+	next_cursor = None
+	if len(items) > page_size:
+		items = items[:page_size]
+		last = items[-1]
+		next_cursor = encode_cursor(getattr(last, order_field), getattr(last, pk_field))
+
+	return items, next_cursor
@@ -0,0 +1,181 @@
+import re
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from .models import SearchDocument
+
+FTS_TABLE = 'store_searchdocument_fts'
+MAX_RESULTS = getattr(settings, 'SEARCH_MAX_RESULTS', 500)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+	return TOKEN_RE.findall(query.lower())
+
+
+class BaseSearchBackend:
+	"""
+	Search backends return product ids ranked best match first.
+
+	The index itself lives on SearchDocument; backends only differ in how
+	they query it and in what the database needs to keep it current.
+	"""
+	def search(self, query, limit=MAX_RESULTS, within=None):
+		"""
+		Ranked ids of the best limit matches. within, a queryset of product
+		ids, restricts the matches before they are ranked and cut, so filters
+		applied through it never lose products that ranked past the limit.
+		"""
+		raise NotImplementedError
+
+	def matches(self, query):
+		"""Every matching product id, unranked and uncapped, as something usable in product_id__in"""
+		raise NotImplementedError
+
+	def index_products(self, product_ids):
+		SearchDocument.refresh(product_ids)
+
+	def rebuild(self):
+		SearchDocument.objects.all().delete()
+		return SearchDocument.refresh()
+
+
+class BasicSearchBackend(BaseSearchBackend):
+	"""Fallback for databases without a full text engine: substring match, no ranking"""
+	def _documents(self, query):
+		documents = SearchDocument.objects.all()
+		for token in tokenize(query):
+			documents = documents.filter(
+				Q(name__icontains=token) |
+				Q(body__icontains=token) |
+				Q(category_name__icontains=token)
+			)
+		return documents
+
+	def search(self, query, limit=MAX_RESULTS, within=None):
+		if not tokenize(query):
+			return []
+		documents = self._documents(query)
+		if within is not None:
+			documents = documents.filter(product_id__in=within)
+		return list(documents.values_list('product_id', flat=True)[:limit])
+
+	def matches(self, query):
+		if not tokenize(query):
+			return SearchDocument.objects.none().values('product_id')
+		return self._documents(query).values('product_id')
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+	"""
+	FTS5 external-content table over store_searchdocument, kept in sync by
+	triggers. Ranked with bm25(), weighting name > category > description.
+	"""
+	@staticmethod
+	def _match_expression(tokens):
+		# Every token must match, the last one as a prefix so partial words still hit
+		terms = ['"%s"' % token for token in tokens[:-1]]
+		terms.append('"%s"*' % tokens[-1])
+		return ' '.join(terms)
+
+	def search(self, query, limit=MAX_RESULTS, within=None):
+		tokens = tokenize(query)
+		if not tokens:
+			return []
+
+		sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+		params = [self._match_expression(tokens)]
+		if within is not None:
+			within_sql, within_params = within.query.sql_with_params()
+			sql += f" AND rowid IN ({within_sql})"
+			params.extend(within_params)
+		sql += f" ORDER BY bm25({FTS_TABLE}, 10.0, 1.0, 5.0) LIMIT %s"
+		params.append(limit)
+
+		with connection.cursor() as cursor:
+			cursor.execute(sql, params)
+			return [row[0] for row in cursor.fetchall()]
+
+	def matches(self, query):
+		tokens = tokenize(query)
+		if not tokens:
+			return SearchDocument.objects.none().values('product_id')
+		return RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [self._match_expression(tokens)])
+
+	def rebuild(self):
+		count = super().rebuild()
+		with connection.cursor() as cursor:
+			cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+			cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+		return count
+
+
+class MySQLFullTextBackend(BaseSearchBackend):
+	"""
+	InnoDB FULLTEXT index on (name, body, category_name). InnoDB scores
+	matches with a BM25-style TF-IDF ranking, returned by MATCH ... AGAINST.
+	"""
+	MATCH_SQL = "MATCH(name, body, category_name) AGAINST (%s IN BOOLEAN MODE)"
+
+	@staticmethod
+	def _boolean_query(tokens):
+		terms = ['+%s' % token for token in tokens[:-1]]
+		terms.append('+%s*' % tokens[-1])
+		return ' '.join(terms)
+
+	def search(self, query, limit=MAX_RESULTS, within=None):
+		tokens = tokenize(query)
+		if not tokens:
+			return []
+
+		boolean_query = self._boolean_query(tokens)
+		table = SearchDocument._meta.db_table
+		sql = f"SELECT product_id FROM {table} WHERE {self.MATCH_SQL}"
+		params = [boolean_query]
+		if within is not None:
+			within_sql, within_params = within.query.sql_with_params()
+			sql += f" AND product_id IN ({within_sql})"
+			params.extend(within_params)
+		sql += f" ORDER BY {self.MATCH_SQL} DESC LIMIT %s"
+		params.extend([boolean_query, limit])
+
+		with connection.cursor() as cursor:
+			cursor.execute(sql, params)
+			return [row[0] for row in cursor.fetchall()]
+
+	def matches(self, query):
+		tokens = tokenize(query)
+		if not tokens:
+			return SearchDocument.objects.none().values('product_id')
+		table = SearchDocument._meta.db_table
+		return RawSQL(f"SELECT product_id FROM {table} WHERE {self.MATCH_SQL}", [self._boolean_query(tokens)])
+
+	def rebuild(self):
+		count = super().rebuild()
+		with connection.cursor() as cursor:
+			cursor.execute(f"OPTIMIZE TABLE {SearchDocument._meta.db_table}")
+		return count
+
+
+VENDOR_BACKENDS = {
+	'sqlite': SQLiteFTSBackend,
+	'mysql': MySQLFullTextBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+	"""Backend named by settings.SEARCH_BACKEND, else the one matching the database"""
+	global _backend
+	if _backend is None:
+		backend_path = getattr(settings, 'SEARCH_BACKEND', None)
+		if backend_path:
+			backend_class = import_string(backend_path)
+		else:
+			backend_class = VENDOR_BACKENDS.get(connection.vendor, BasicSearchBackend)
+		_backend = backend_class()
+	return _backend
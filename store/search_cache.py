@@ -0,0 +1,65 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from .catalog import get_catalog_version
+
+SEARCH_CACHE_TIMEOUT = getattr(settings, 'SEARCH_CACHE_TIMEOUT', 300)
+
+HITS_KEY = 'search:cache:hits'
+MISSES_KEY = 'search:cache:misses'
+
+
+def normalize_query(query):
+	return ' '.join(query.lower().split())
+
+
+def cache_key(query, **params):
+	"""
+	Key on the normalised query plus filters and sort. The catalog version is
+	part of the key, so one product or category write retires every entry.
+	"""
+	payload = json.dumps([normalize_query(query), params], sort_keys=True)
+	digest = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+	return f'search:results:{get_catalog_version()}:{digest}'
+
+
+def _count(key):
+	try:
+		cache.incr(key)
+	except ValueError:
+		if not cache.add(key, 1, timeout=None):
+			cache.incr(key)
+
+
+def get(key):
+	"""Cached {'ids', 'total', 'facets'} for a key, or None; counts the hit or miss"""
+	entry = cache.get(key)
+	_count(HITS_KEY if entry is not None else MISSES_KEY)
+	return entry
+
+
+def set(key, product_ids, facet_counts, total=None):
+	"""total: every match, when product_ids holds only the first page of a capped ranking"""
+	cache.set(key, {
+		'ids': list(product_ids),
+		'total': len(product_ids) if total is None else total,
+		'facets': facet_counts,
+	}, SEARCH_CACHE_TIMEOUT)
+
+
+def stats():
+	counters = cache.get_many([HITS_KEY, MISSES_KEY])
+	hits = counters.get(HITS_KEY, 0)
+	misses = counters.get(MISSES_KEY, 0)
+	lookups = hits + misses
+	return {
+		'hits': hits,
+		'misses': misses,
+		'hit_rate': round(hits / lookups, 4) if lookups else None,
+		'catalog_version': get_catalog_version(),
+	}
+
+
+def reset_stats():
+	cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,119 @@
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from .models import Category, Product, ProductVariant, ProductImage, ProductCard, SearchDocument, Comment, Reply
+from .search import get_search_backend
+from .catalog import bump_catalog_version
+from . import facets
+
+
+class CatalogRefresh:
+	"""
+	Products touched by one transaction, refreshed together once it commits.
+	An admin save with N variant or image inlines rebuilds each manifest and
+	card once and bumps the catalog version once, not N times.
+	"""
+	def __init__(self):
+		self.cards = set()
+		self.galleries = set()
+		self.search = set()
+		self.queued = False
+		self.done = False
+
+	@classmethod
+	def current(cls):
+		"""The batch whose callback is queued on the open transaction, started on first use"""
+		batch = getattr(connection, '_store_catalog_refresh', None)
+		# A rollback discards the queued callback together with its batch; a batch that
+		# already ran (callbacks run early, as in TestCase.captureOnCommitCallbacks) is spent
+		if batch is None or batch.done or not any(hook[1] == batch.run for hook in connection.run_on_commit):
+			batch = connection._store_catalog_refresh = cls()
+		return batch
+
+	def queue(self):
+		# Outside a transaction this runs at once, so ids are added before queueing
+		if not self.queued:
+			self.queued = True
+			transaction.on_commit(self.run)
+
+	def run(self):
+		self.done = True
+		# Deferred so cascaded deletes have finished before we look the products up again
+		if self.galleries:
+			# Also moves seo_updated_at, the key of the cached product page fragments
+			Product.refresh_gallery_manifest(self.galleries)
+		facets.refresh_cards(sorted(self.cards))
+		if self.search:
+			get_search_backend().index_products(sorted(self.search))
+		bump_catalog_version()
+
+
+def refresh_on_commit(product_id, gallery=False, search=False):
+	batch = CatalogRefresh.current()
+	batch.cards.add(product_id)
+	if gallery:
+		batch.galleries.add(product_id)
+	if search:
+		batch.search.add(product_id)
+	batch.queue()
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleting(sender, instance, **kwargs):
+	facets.remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+	refresh_on_commit(instance.pk, search=True)
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def variant_changed(sender, instance, **kwargs):
+	refresh_on_commit(instance.product_id, gallery=True)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def image_changed(sender, instance, **kwargs):
+	product_id = ProductVariant.objects.filter(pk=instance.variant_id).values_list('product_id', flat=True).first()
+	if product_id:
+		refresh_on_commit(product_id, gallery=True)
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, created, **kwargs):
+	if not created:
+		ProductCard.objects.filter(category=instance).update(category_name=instance.name)
+		SearchDocument.objects.filter(product__category=instance).update(category_name=instance.name)
+	transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+	transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Comment)
+def comment_added(sender, instance, created, **kwargs):
+	if created:
+		Product.objects.filter(pk=instance.product_id).update(comment_count=F('comment_count') + 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_removed(sender, instance, **kwargs):
+	Product.objects.filter(pk=instance.product_id, comment_count__gt=0).update(comment_count=F('comment_count') - 1)
+
+
+@receiver(post_save, sender=Reply)
+def reply_added(sender, instance, created, **kwargs):
+	if created:
+		Comment.objects.filter(pk=instance.parent_comment_id).update(reply_count=F('reply_count') + 1)
+
+
+@receiver(post_delete, sender=Reply)
+def reply_removed(sender, instance, **kwargs):
+	Comment.objects.filter(pk=instance.parent_comment_id, reply_count__gt=0).update(reply_count=F('reply_count') - 1)
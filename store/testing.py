@@ -0,0 +1,52 @@
+import threading
+import time
+from django.db import OperationalError, connection
+
+# Per-process cache for tests that exercise caching without a cache server
+LOCMEM_CACHES = {
+	'default': {
+		'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+		'LOCATION': 'tests',
+	}
+}
+
+
+def run_in_threads(fn, threads, repeat=1, setup=None):
+	"""
+	Call fn `repeat` times from each of `threads` threads released together, and
+	return every result, thread by thread. fn gets setup(index), run before the
+	threads are released, or the thread index when there is no setup.
+	For TransactionTestCase: each thread uses and then closes its own connection.
+	"""
+	results = [[] for _ in range(threads)]
+	barrier = threading.Barrier(threads)
+
+	def call(argument):
+		while True:
+			try:
+				return fn(argument)
+			except OperationalError:
+				# SQLite's shared in-memory test database reports "table is locked"
+				# instead of waiting. fn is one statement or one transaction, so
+				# nothing of the failed call was applied: retry it
+				time.sleep(0.001)
+
+	def worker(index):
+		try:
+			try:
+				argument = setup(index) if setup else index
+			except BaseException:
+				barrier.abort()
+				raise
+			barrier.wait()
+			for _ in range(repeat):
+				results[index].append(call(argument))
+		finally:
+			connection.close()
+
+	workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+	for worker_thread in workers:
+		worker_thread.start()
+	for worker_thread in workers:
+		worker_thread.join()
+	return [result for thread_results in results for result in thread_results]
@@ -1,3 +1,356 @@
-from django.test import TestCase
+from unittest import mock, skipUnless
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from .autocomplete import PrefixIndex
+from .catalog import category_product_ids
+from .models import Category, Comment, FacetCount, Product, ProductCard, ProductImage, ProductVariant, Reply
+from .pagination import keyset_page
+from .search import BasicSearchBackend, SQLiteFTSBackend
+from . import facets, search_cache
+from .testing import LOCMEM_CACHES
+from . import views
 
-# Create your tests here.
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogTestCase(TestCase):
+	"""Runs the on_commit refreshes (cards, facet counts, search index, catalog version) the store signals queue"""
+	def setUp(self):
+		cache.clear()
+		self.category = self.create_category('Lamps')
+
+	def create_category(self, name):
+		with self.captureOnCommitCallbacks(execute=True):
+			return Category.objects.create(name=name)
+
+	def create_product(self, **fields):
+		fields.setdefault('category', self.category)
+		with self.captureOnCommitCallbacks(execute=True):
+			return Product.objects.create(**fields)
+
+
+class HomeFeedTests(CatalogTestCase):
+	def walk(self, page_size):
+		ids, cursor = [], None
+		while True:
+			page, cursor = keyset_page(ProductCard.objects.all(), cursor=cursor, page_size=page_size, pk_field='pk')
+			ids.extend(card.pk for card in page)
+			if cursor is None:
+				return ids
+
+	def test_pages_neither_overlap_nor_skip(self):
+		products = [self.create_product(name=f'Lamp {number}', price=10) for number in range(7)]
+
+		self.assertEqual(self.walk(3), [product.pk for product in reversed(products)])
+
+	def test_new_products_do_not_shift_later_pages(self):
+		products = [self.create_product(name=f'Lamp {number}', price=10) for number in range(4)]
+
+		first, cursor = keyset_page(ProductCard.objects.all(), page_size=2, pk_field='pk')
+		self.create_product(name='Newcomer', price=10)
+		second, cursor = keyset_page(ProductCard.objects.all(), cursor=cursor, page_size=2, pk_field='pk')
+
+		self.assertEqual([card.pk for card in first + second], [product.pk for product in reversed(products)])
+		self.assertIsNone(cursor)
+
+	def test_bad_cursor_is_rejected(self):
+		response = views.home_feed(RequestFactory().get('/feed/', {'cursor': 'not-a-cursor'}))
+
+		self.assertEqual(response.status_code, 400)
+
+
+class ProductCardTests(CatalogTestCase):
+	def test_card_follows_product_changes(self):
+		product = self.create_product(name='Desk Lamp', price=40, sale_price=30, stock=5)
+		card = ProductCard.objects.get(pk=product.pk)
+		self.assertEqual((card.name, card.effective_price, card.stock_band), ('Desk Lamp', 40, 'low_stock'))
+
+		product.is_sale = True
+		product.stock = 50
+		with self.captureOnCommitCallbacks(execute=True):
+			product.save()
+
+		card.refresh_from_db()
+		self.assertEqual((card.effective_price, card.is_sale, card.stock_band), (30, True, 'in_stock'))
+
+	def test_category_rename_reaches_cards(self):
+		product = self.create_product(name='Desk Lamp', price=40)
+
+		self.category.name = 'Lighting'
+		with self.captureOnCommitCallbacks(execute=True):
+			self.category.save()
+
+		self.assertEqual(ProductCard.objects.get(pk=product.pk).category_name, 'Lighting')
+
+	def test_card_goes_with_its_product(self):
+		product = self.create_product(name='Desk Lamp', price=40)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			product.delete()
+
+		self.assertFalse(ProductCard.objects.exists())
+
+
+class SearchBackendTests(CatalogTestCase):
+	def setUp(self):
+		super().setUp()
+		self.lamp = self.create_product(name='Brass Lamp', price=30)
+		self.chair = self.create_product(
+			name='Reading Chair', description='<p>Pairs well with a lamp</p>', price=90,
+			category=self.create_category('Furniture')
+		)
+
+	@skipUnless(connection.vendor == 'sqlite', 'FTS5 backend')
+	def test_name_matches_rank_above_description_matches(self):
+		self.assertEqual(SQLiteFTSBackend().search('lamp'), [self.lamp.pk, self.chair.pk])
+
+	@skipUnless(connection.vendor == 'sqlite', 'FTS5 backend')
+	def test_last_word_matches_as_prefix(self):
+		self.assertEqual(SQLiteFTSBackend().search('brass la'), [self.lamp.pk])
+
+	@skipUnless(connection.vendor == 'sqlite', 'FTS5 backend')
+	def test_filters_apply_before_the_result_cap(self):
+		within = ProductCard.objects.filter(category=self.chair.category).values('product_id')
+
+		self.assertEqual(SQLiteFTSBackend().search('lamp', limit=1, within=within), [self.chair.pk])
+
+	def test_basic_backend_matches_substrings(self):
+		backend = BasicSearchBackend()
+
+		self.assertEqual(set(backend.search('lamp')), {self.lamp.pk, self.chair.pk})
+		self.assertEqual(backend.search('brass lamp'), [self.lamp.pk])
+		self.assertEqual(backend.search('  '), [])
+
+
+class FacetCountTests(CatalogTestCase):
+	def counts(self):
+		return set(FacetCount.objects.filter(count__gt=0).values_list('scope', 'facet', 'value', 'count'))
+
+	def test_deltas_match_a_full_rebuild(self):
+		chairs = self.create_category('Chairs')
+		lamp = self.create_product(name='Desk Lamp', price=40, stock=20)
+		self.create_product(name='Floor Lamp', price=150, stock=0)
+		chair = self.create_product(name='Armchair', price=600, sale_price=450, stock=3, category=chairs)
+
+		lamp.price = 120
+		lamp.category = chairs
+		chair.is_sale = True
+		with self.captureOnCommitCallbacks(execute=True):
+			lamp.save()
+			chair.save()
+		with self.captureOnCommitCallbacks(execute=True):
+			Product.objects.get(name='Floor Lamp').delete()
+
+		maintained = self.counts()
+		facets.rebuild_facet_counts()
+		self.assertEqual(maintained, self.counts())
+
+	def test_precomputed_facets_are_scoped_to_the_category(self):
+		chairs = self.create_category('Chairs')
+		self.create_product(name='Desk Lamp', price=40, stock=20)
+		self.create_product(name='Armchair', price=600, stock=20, category=chairs)
+
+		counts = facets.precomputed_facets(chairs.pk)
+
+		self.assertEqual(counts['category'], {str(self.category.pk): 1, str(chairs.pk): 1})
+		self.assertEqual(counts['price'], {facets.price_bucket(600): 1})
+
+
+class PrefixIndexTests(SimpleTestCase):
+	def setUp(self):
+		self.index = PrefixIndex([
+			{'label': 'iPhone 17 Pro Max', 'popularity': 5},
+			{'label': 'Pro Max Case', 'popularity': 9},
+			{'label': 'Procreate Stylus', 'popularity': 1},
+			{'label': 'Café Lamp', 'popularity': 2},
+		], top_n=8)
+
+	def labels(self, prefix, limit=None):
+		return [entry['label'] for entry in self.index.search(prefix, limit)]
+
+	def test_any_word_start_matches_most_popular_first(self):
+		self.assertEqual(self.labels('pro max'), ['Pro Max Case', 'iPhone 17 Pro Max'])
+		self.assertEqual(self.labels('pro'), ['Pro Max Case', 'iPhone 17 Pro Max', 'Procreate Stylus'])
+
+	def test_matching_ignores_case_accents_and_spacing(self):
+		self.assertEqual(self.labels('  CAFE   la'), ['Café Lamp'])
+
+	def test_limit_and_empty_prefix(self):
+		self.assertEqual(self.labels('pro', limit=1), ['Pro Max Case'])
+		self.assertEqual(self.labels(''), [])
+		self.assertEqual(self.labels('lamp shade'), [])
+
+
+class SearchCacheTests(CatalogTestCase):
+	def test_key_normalises_the_query_but_not_the_filters(self):
+		key = search_cache.cache_key('  Desk   LAMP ', sort='name')
+
+		self.assertEqual(key, search_cache.cache_key('desk lamp', sort='name'))
+		self.assertNotEqual(key, search_cache.cache_key('desk lamp', sort='price_low'))
+
+	def test_catalog_write_retires_cached_results(self):
+		key = search_cache.cache_key('lamp')
+		search_cache.set(key, [1, 2], {'category': {}})
+		self.assertEqual(search_cache.get(key)['total'], 2)
+
+		self.create_product(name='Desk Lamp', price=40)
+
+		self.assertIsNone(search_cache.get(search_cache.cache_key('lamp')))
+		self.assertEqual(
+			{name: value for name, value in search_cache.stats().items() if name in ('hits', 'misses')},
+			{'hits': 1, 'misses': 1}
+		)
+
+
+class CategoryTests(CatalogTestCase):
+	def test_slugs_are_unique_and_never_empty(self):
+		slugs = [self.create_category(name).slug for name in ('Phone Cases', 'Phone  cases', '!!!', '???')]
+
+		self.assertEqual(slugs, ['phone-cases', 'phone-cases-2', 'category', 'category-2'])
+
+	def test_name_links_redirect_to_the_slug(self):
+		self.create_category('Phone')
+
+		response = views.category(RequestFactory().get('/category/Phone'), 'Phone')
+
+		self.assertEqual(response.status_code, 301)
+		self.assertEqual(response['Location'], reverse('category', args=['phone']))
+
+	def test_cached_listing_picks_up_new_products(self):
+		older = self.create_product(name='Desk Lamp', price=40)
+		self.assertEqual(category_product_ids(self.category, 'newest'), [older.pk])
+
+		newer = self.create_product(name='Floor Lamp', price=90)
+
+		self.assertEqual(category_product_ids(self.category, 'newest'), [newer.pk, older.pk])
+
+
+class CommentPagingTests(CatalogTestCase):
+	def setUp(self):
+		super().setUp()
+		self.user = get_user_model().objects.create_user(email='reader@example.com', password='secret')
+		self.product = self.create_product(name='Desk Lamp', price=40)
+
+	def test_comment_pages_do_not_overlap(self):
+		comments = [
+			Comment.objects.create(author=self.user, product=self.product, body=f'Comment {number}')
+			for number in range(views.COMMENTS_PAGE_SIZE + 2)
+		]
+
+		first, cursor = views._comment_page(self.product.pk)
+		second, cursor = views._comment_page(self.product.pk, cursor)
+
+		self.assertEqual([comment.pk for comment in first + second], [comment.pk for comment in reversed(comments)])
+		self.assertIsNone(cursor)
+		self.product.refresh_from_db()
+		self.assertEqual(self.product.comment_count, len(comments))
+
+	def test_reply_preview_continues_with_older_replies(self):
+		comment = Comment.objects.create(author=self.user, product=self.product, body='Bright enough?')
+		replies = [
+			Reply.objects.create(author=self.user, parent_comment=comment, body=f'Reply {number}')
+			for number in range(views.REPLY_PREVIEW_SIZE + 2)
+		]
+
+		[shown], _ = views._comment_page(self.product.pk)
+		older, cursor = keyset_page(
+			Reply.objects.filter(parent_comment=comment), cursor=shown.replies_cursor, order_field='date_added'
+		)
+
+		self.assertEqual(shown.reply_count, len(replies))
+		self.assertEqual(
+			[reply.pk for reply in shown.reply_preview + older],
+			[reply.pk for reply in reversed(replies)]
+		)
+		self.assertIsNone(cursor)
+
+	def test_stale_comment_save_keeps_reply_count(self):
+		comment = Comment.objects.create(author=self.user, product=self.product, body='Bright enough?')
+		stale = Comment.objects.get(pk=comment.pk)
+		Reply.objects.create(author=self.user, parent_comment=comment, body='Yes')
+
+		stale.body = 'Bright enough for reading?'
+		stale.save()
+
+		comment.refresh_from_db()
+		self.assertEqual((comment.body, comment.reply_count), ('Bright enough for reading?', 1))
+
+
+class ProductFragmentKeyTests(CatalogTestCase):
+	def fragment_key(self, product):
+		product.refresh_from_db()
+		return make_template_fragment_key('product_options', [product.pk, product.seo_updated_at])
+
+	def test_partial_save_moves_the_key(self):
+		product = self.create_product(name='Desk Lamp', price=40, stock=5)
+		before = self.fragment_key(product)
+
+		product.stock = 4
+		product.save(update_fields=['stock'])
+
+		self.assertNotEqual(self.fragment_key(product), before)
+
+	def test_variant_change_moves_the_key(self):
+		product = self.create_product(name='Desk Lamp', price=40)
+		before = self.fragment_key(product)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			ProductVariant.objects.create(product=product, color_name='Brass')
+
+		self.assertNotEqual(self.fragment_key(product), before)
+
+
+class GalleryManifestTests(CatalogTestCase):
+	def setUp(self):
+		super().setUp()
+		self.product = self.create_product(name='Desk Lamp', price=40)
+
+	def add_variant(self, color_name, images=()):
+		with self.captureOnCommitCallbacks(execute=True):
+			variant = ProductVariant.objects.create(product=self.product, color_name=color_name)
+			for image in images:
+				ProductImage.objects.create(variant=variant, image=image)
+		return variant
+
+	def gallery(self, etag=None):
+		headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+		return views.product_gallery(RequestFactory().get('/', **headers), self.product.pk)
+
+	def test_manifest_lists_variants_and_images(self):
+		self.add_variant('Brass', ['uploads/product/1.jpg', 'uploads/product/2.jpg'])
+		self.add_variant('Black')
+
+		self.product.refresh_from_db()
+		manifest = self.product.gallery_manifest['variants']
+		self.assertEqual([variant['color_name'] for variant in manifest], ['Brass', 'Black'])
+		self.assertEqual(
+			manifest[0]['images'],
+			[image.image.url for image in ProductImage.objects.filter(variant__color_name='Brass').order_by('id')]
+		)
+
+	def test_manifest_is_built_once_per_product_per_transaction(self):
+		with mock.patch.object(Product, 'refresh_gallery_manifest', wraps=Product.refresh_gallery_manifest) as refresh:
+			self.add_variant('Brass', ['uploads/product/1.jpg', 'uploads/product/2.jpg'])
+
+		refresh.assert_called_once_with({self.product.pk})
+
+	def test_etag_revalidates_until_the_gallery_changes(self):
+		etag = self.gallery()['ETag']
+
+		self.assertEqual(self.gallery(etag).status_code, 304)
+		self.add_variant('Brass')
+		self.assertEqual(self.gallery(etag).status_code, 200)
+
+	def test_stale_full_save_keeps_the_manifest(self):
+		stale = Product.objects.get(pk=self.product.pk)
+		self.add_variant('Brass')
+
+		stale.name = 'Brass Desk Lamp'
+		with self.captureOnCommitCallbacks(execute=True):
+			stale.save()
+
+		self.product.refresh_from_db()
+		self.assertEqual(len(self.product.gallery_manifest['variants']), 1)
@@ -6,6 +6,7 @@ from . import views
 
 urlpatterns = [
     path('', views.home,  name='home'),
+    path('feed/', views.home_feed, name='home_feed'),
     path('about_us/', views.about_us, name='about_us'),
     path('contact_us/', views.contact, name='contact_us'),
     path('cookies', views.cookies, name='cookies'),
@@ -20,8 +21,9 @@ urlpatterns = [
     path('resend-otp/', views.resend_otp_view, name='resend_otp'),
     path('product/<slug:slug>/', views.product, name='product'),
     path('get-images/<int:variant_id>/', views.get_variant_images, name='get_variant_images'),
+    path('product/<int:product_id>/gallery/', views.product_gallery, name='product_gallery'),
     path('toggle-favorite/<int:product_id>/', views.toggle_favorite, name="toggle_favorite"),
-    path('category/<str:foo>', views.category,  name='category'),
+    path('category/<str:slug>', views.category,  name='category'),
     path('account/update_user/', views.update_user, name='update_user'),
     path('account/update_password/', views.update_password, name='update_password'),
     path('account/addresses/', views.update_address, name='update_address'),  # List
@@ -32,11 +34,15 @@ urlpatterns = [
     path('add-phone-number/', views.add_phone_number, name='add_phone_number'),
     path('verify-firebase-phone/', views.verify_firebase_phone, name='verify_firebase_phone'),
     path('add-comment/<int:product_id>/', views.add_comment, name='add_comment'),
+    path('product/<int:product_id>/comments/', views.product_comments, name='product_comments'),
+    path('comment/<int:comment_id>/replies/', views.comment_replies, name='comment_replies'),
     path('data-deletion/', TemplateView.as_view(template_name='data_deletion.html'), name='data_deletion'),
     path('delete-comment/<int:comment_id>/', views.delete_comment, name='delete_comment'),
     path('add-reply/<int:comment_id>/', views.add_reply, name='add_reply'),
     path('delete-reply/<int:reply_id>/', views.delete_reply, name='delete_reply'),
     path('search/', views.search, name='search'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
+    path('search/stats/', views.search_cache_stats, name='search_cache_stats'),
     path('forgot-password/', views.forgot_password, name='forgot_password'),
     path('reset-password/', views.reset_password, name='reset_password'),
     path('resend-reset-otp/', views.resend_reset_otp, name='resend_reset_otp'),
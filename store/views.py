@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Product, ProductVariant, ProductImage, Favorite, Category, Reply, Comment
+from .models import Product, ProductVariant, ProductImage, ProductCard, Favorite, Category, Reply, Comment
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth import get_user_model
@@ -28,15 +28,32 @@ from django.views import View
 from django.urls import is_valid_path
 from django.utils.http import url_has_allowed_host_and_scheme
 from .mailchimp_service import MailchimpService
-from django.db.models import Q
-from django.db.models import Prefetch
+from django.db.models import Prefetch, prefetch_related_objects
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, etag
+from django.views.decorators.cache import cache_control
 from django.core.mail import send_mail
+from .pagination import keyset_page, encode_cursor, InvalidCursor
+from .search import get_search_backend
+from . import facets
+from . import autocomplete
+from . import search_cache
+from .catalog import category_map, category_product_ids, CATEGORY_SORTS
+from django.core.paginator import Paginator
+from django.utils.text import slugify
 # Create your views here.
 
+HOME_PAGE_SIZE = getattr(settings, 'HOME_PAGE_SIZE', 24)
+CATEGORY_PAGE_SIZE = getattr(settings, 'CATEGORY_PAGE_SIZE', 24)
+COMMENTS_PAGE_SIZE = getattr(settings, 'COMMENTS_PAGE_SIZE', 10)
+REPLY_PREVIEW_SIZE = getattr(settings, 'REPLY_PREVIEW_SIZE', 3)
+REPLIES_PAGE_SIZE = getattr(settings, 'REPLIES_PAGE_SIZE', 20)
+# Product page fragments are keyed on seo_updated_at, so this only bounds how long stale keys linger
+PRODUCT_FRAGMENT_TIMEOUT = getattr(settings, 'PRODUCT_FRAGMENT_TIMEOUT', 60 * 60 * 24)
+GALLERY_MAX_AGE = getattr(settings, 'GALLERY_MAX_AGE', 60 * 60)
+
 class GoogleVerificationView(View):
 	def get(self, request):
 		return HttpResponse("google-site-verification: google9162f3f05492581f.html")
@@ -48,7 +65,12 @@ class RobotsView(TemplateView):
 	content_type = 'text/plain'
 
 def home(request):
-	products = Product.objects.all()
+	# Only the first page is rendered, the rest is pulled in by home_feed
+	products, next_cursor = keyset_page(
+		ProductCard.objects.all(),
+		page_size=HOME_PAGE_SIZE,
+		pk_field='pk'
+	)
 	
 	# Get user's favorites to show on home page
 	favorites = []
@@ -57,10 +79,32 @@ def home(request):
 	
 	return render(request, 'home.html', {
 		'products': products,
+		'next_cursor': next_cursor,
 		'favorites': list(favorites)
 	})
 
 
+def home_feed(request):
+	"""Infinite scroll endpoint: next page of product cards as an HTML fragment"""
+	try:
+		products, next_cursor = keyset_page(
+			ProductCard.objects.all(),
+			cursor=request.GET.get('cursor'),
+			page_size=HOME_PAGE_SIZE,
+			pk_field='pk'
+		)
+	except InvalidCursor:
+		return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+
+	html = render_to_string('home_product_cards.html', {'products': products}, request=request)
+	return JsonResponse({
+		'success': True,
+		'html': html,
+		'count': len(products),
+		'next_cursor': next_cursor
+	})
+
+
 def about_us(request):
 	return render (request, 'about_us.html', {})
 
@@ -263,28 +307,32 @@ def resend_otp_view(request):
 	return redirect('verify_otp')
 
 
-def product(request, slug):
-	# Optimize with select_related and prefetch_related
-	product = get_object_or_404(
-		Product.objects
-			.select_related('category')  # Get category in same query
-			.prefetch_related(
-				'variants__images',  # Preload all variant images
-				Prefetch(
-					'comments',
-					queryset=Comment.objects.select_related('author')
-										   .prefetch_related(
-											   Prefetch(
-												   'replies',
-												   queryset=Reply.objects.select_related('author')
-											   )
-										   )
-										   .order_by('-date_added')
-				)
-			),
-		slug=slug
+def _comment_page(product_id, cursor=None):
+	"""One page of a product's comments, each carrying its newest replies as reply_preview"""
+	comments, next_cursor = keyset_page(
+		Comment.objects.filter(product_id=product_id).select_related('author'),
+		cursor=cursor,
+		page_size=COMMENTS_PAGE_SIZE,
+		order_field='date_added'
 	)
+	prefetch_related_objects(comments, Prefetch(
+		'replies',
+		queryset=Reply.objects.select_related('author').order_by('-date_added', '-id')[:REPLY_PREVIEW_SIZE],
+		to_attr='reply_preview'
+	))
+	for comment in comments:
+		comment.replies_cursor = None
+		if comment.reply_count > len(comment.reply_preview):
+			last = comment.reply_preview[-1]
+			comment.replies_cursor = encode_cursor(last.date_added, last.id)
+	return comments, next_cursor
+
+
+def product(request, slug):
+	product = get_object_or_404(Product.objects.select_related('category'), slug=slug)
 	
+	# Only the first page of comments is rendered, the rest comes from product_comments
+	comments, next_cursor = _comment_page(product.id)
 	comment_form = CommentForm()
 	
 	# Get user's favorites
@@ -292,19 +340,73 @@ def product(request, slug):
 	if request.user.is_authenticated:
 		favorites = list(Favorite.objects.filter(user=request.user).values_list('product_id', flat=True))
 	
-	# Cache first variant and image for template
-	first_variant = product.variants.first() if product.variants.exists() else None
-	first_image = first_variant.images.first() if first_variant and first_variant.images.exists() else None
+	# Needed live for the meta tags; everything else about variants is only
+	# read when a cached fragment is missing, so keep it a lazy queryset
+	first_variant = product.variants.first()
+	first_image = first_variant.images.first() if first_variant else None
 	
 	return render(request, 'product.html', {
 		'product': product,
+		'variants': product.variants.prefetch_related('images'),
 		'first_variant': first_variant,
 		'first_image': first_image,
+		'fragment_timeout': PRODUCT_FRAGMENT_TIMEOUT,
 		'favorites': favorites,
+		'comments': comments,
+		'comments_cursor': next_cursor,
 		'comment_form': comment_form
 	})
 
+
+def product_comments(request, product_id):
+	"""Load-more endpoint: next page of comments as an HTML fragment"""
+	try:
+		comments, next_cursor = _comment_page(product_id, request.GET.get('cursor'))
+	except InvalidCursor:
+		return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+
+	html = render_to_string('product_comments.html', {'comments': comments}, request=request)
+	return JsonResponse({
+		'success': True,
+		'html': html,
+		'count': len(comments),
+		'next_cursor': next_cursor
+	})
+
+
+def comment_replies(request, comment_id):
+	"""Load-more endpoint: older replies to one comment as an HTML fragment"""
+	try:
+		replies, next_cursor = keyset_page(
+			Reply.objects.filter(parent_comment_id=comment_id).select_related('author'),
+			cursor=request.GET.get('cursor'),
+			page_size=REPLIES_PAGE_SIZE,
+			order_field='date_added'
+		)
+	except InvalidCursor:
+		return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+
+	html = render_to_string('product_replies.html', {'replies': replies}, request=request)
+	return JsonResponse({
+		'success': True,
+		'html': html,
+		'count': len(replies),
+		'next_cursor': next_cursor
+	})
+
 	
+def _gallery_etag(request, product_id):
+	updated = Product.objects.filter(pk=product_id).values_list('seo_updated_at', flat=True).first()
+	return f'"{product_id}-{updated.timestamp()}"' if updated else None
+
+
+@cache_control(public=True, max_age=GALLERY_MAX_AGE)
+@etag(_gallery_etag)
+def product_gallery(request, product_id):
+	"""The stored gallery manifest; revalidated with If-None-Match, so repeat fetches cost one indexed lookup"""
+	manifest = get_object_or_404(Product.objects.only('gallery_manifest'), pk=product_id).gallery_manifest
+	return JsonResponse(manifest)
+
 
 def get_variant_images(request, variant_id):
 	variant = get_object_or_404(ProductVariant, id=variant_id)
@@ -334,16 +436,33 @@ def toggle_favorite(request, product_id):
 		return JsonResponse({'status': 'added'})
 
 
-def category(request, foo):
-	#replace hyphens with spaces
-	foo = foo.replace('-', ' ')
-	try:
-		category = Category.objects.get(name=foo)
-		products = Product.objects.filter(category=category)
-		return render(request, 'category.html', {'products':products, 'category':category})
-	except:
-		messages.success(request, ("That Category didn't exist"))
-		return redirect('home')
+def category(request, slug):
+	category = category_map.get(slug)
+	if category is None:
+		# Old links used the category name, e.g. /category/Phone
+		category = category_map.get(slugify(slug))
+		if category is None:
+			messages.success(request, ("That Category didn't exist"))
+			return redirect('home')
+		return redirect('category', slug=category.slug, permanent=True)
+	
+	sort_by = request.GET.get('sort', 'newest')
+	if sort_by not in CATEGORY_SORTS:
+		sort_by = 'newest'
+	
+	# Ids come from the cache, so a page costs one query for its cards
+	paginator = Paginator(category_product_ids(category, sort_by), CATEGORY_PAGE_SIZE)
+	page = paginator.get_page(request.GET.get('page'))
+	cards = ProductCard.objects.in_bulk(page.object_list)
+	products = [cards[product_id] for product_id in page.object_list if product_id in cards]
+	
+	return render(request, 'category.html', {
+		'products': products,
+		'category': category,
+		'page': page,
+		'total_products': paginator.count,
+		'selected_sort': sort_by
+	})
 
 @login_required
 def update_user(request):
@@ -744,9 +863,12 @@ def add_comment(request, product_id):
 			comment.author = request.user
 			comment.product = product
 			comment.save()
+			product.refresh_from_db(fields=['comment_count'])
 			
 			return JsonResponse({
 				'success': True,
+				'comment_id': comment.id,
+				'comment_count': product.comment_count,
 				'author_name': request.user.get_display_name(),
 				'body': comment.body,
 				'date_added': comment.date_added.strftime('%b %d, %Y')
@@ -768,8 +890,10 @@ def delete_comment(request, comment_id):
 	if comment.author != request.user:
 		return JsonResponse({'success': False, 'message': 'Unauthorized'}, status=403)
 	
+	product_id = comment.product_id
 	comment.delete()
-	return JsonResponse({'success': True})
+	comment_count = Product.objects.filter(id=product_id).values_list('comment_count', flat=True).first() or 0
+	return JsonResponse({'success': True, 'comment_count': comment_count})
 
 @login_required
 def add_reply(request, comment_id):
@@ -783,10 +907,12 @@ def add_reply(request, comment_id):
 				parent_comment=comment,
 				body=body
 			)
+			comment.refresh_from_db(fields=['reply_count'])
 			
 			return JsonResponse({
 				'success': True,
 				'reply_id': reply.id,
+				'reply_count': comment.reply_count,
 				'author_name': request.user.get_display_name(),
 				'body': reply.body,
 				'date_added': reply.date_added.strftime('%b %d, %Y')
@@ -806,29 +932,38 @@ def delete_reply(request, reply_id):
 	if reply.author != request.user:
 		return JsonResponse({'success': False, 'message': 'Unauthorized'}, status=403)
 	
+	comment_id = reply.parent_comment_id
 	reply.delete()
-	return JsonResponse({'success': True})
+	reply_count = Comment.objects.filter(id=comment_id).values_list('reply_count', flat=True).first() or 0
+	return JsonResponse({'success': True, 'reply_count': reply_count})
 
 
-def search(request):
-	query = request.GET.get('q', '')
-	category_filter = request.GET.get('category', '')
-	sort_by = request.GET.get('sort', '')
-	
-	products = Product.objects.all()
-	categories = Category.objects.all()
-	
-	# Apply search query
-	if query:
-		products = products.filter(
-			Q(name__icontains=query) | 
-			Q(description__icontains=query) |
-			Q(category__name__icontains=query)
-		)
+def _search_product_ids(query, category_filter, sort_by, price_filter, on_sale, in_stock):
+	"""Ordered product ids, facet counts and the total match count for one combination of search parameters"""
+	filtered = ProductCard.objects.all()
 	
 	# Apply category filter
 	if category_filter:
-		products = products.filter(category__id=category_filter)
+		filtered = filtered.filter(category__id=category_filter)
+	
+	# Apply facet filters
+	filtered = facets.filter_cards(filtered, price=price_filter, on_sale=on_sale, in_stock=in_stock)
+	
+	products = filtered
+	if query:
+		backend = get_search_backend()
+		matches = backend.matches(query)
+		# Facets count every match, before the category and facet filters
+		facet_counts = facets.facets_for_cards(ProductCard.objects.filter(product_id__in=matches), category_filter)
+		products = filtered.filter(product_id__in=matches)
+		
+		# Without an explicit sort, a text query keeps the backend's relevance order.
+		# The filters go into the backend query, so its result cap applies after them.
+		if sort_by in ('', 'relevance'):
+			product_ids = backend.search(query, within=filtered.values('product_id'))
+			return product_ids, facet_counts, products.count()
+	else:
+		facet_counts = facets.precomputed_facets(category_filter)
 	
 	# Apply sorting
 	if sort_by == 'price_low':
@@ -842,17 +977,82 @@ def search(request):
 	else:
 		products = products.order_by('-created_at')  # default
 	
+	product_ids = list(products.values_list('product_id', flat=True))
+	return product_ids, facet_counts, len(product_ids)
+
+
+def search(request):
+	query = request.GET.get('q', '')
+	category_filter = request.GET.get('category', '')
+	sort_by = request.GET.get('sort', '')
+	price_filter = request.GET.get('price', '')
+	on_sale = request.GET.get('on_sale') == '1'
+	in_stock = request.GET.get('in_stock') == '1'
+	
+	categories = list(Category.objects.all())
+	
+	# Popular queries are answered from the result cache
+	key = search_cache.cache_key(
+		query, category=category_filter, sort=sort_by,
+		price=price_filter, on_sale=on_sale, in_stock=in_stock
+	)
+	cached = search_cache.get(key)
+	if cached is None:
+		product_ids, facet_counts, total_results = _search_product_ids(
+			search_cache.normalize_query(query), category_filter, sort_by, price_filter, on_sale, in_stock
+		)
+		search_cache.set(key, product_ids, facet_counts, total_results)
+	else:
+		product_ids, facet_counts, total_results = cached['ids'], cached['facets'], cached['total']
+	
+	cards = ProductCard.objects.in_bulk(product_ids)
+	products = [cards[product_id] for product_id in product_ids if product_id in cards]
+	
+	for category in categories:
+		category.facet_count = facet_counts['category'].get(str(category.id), 0)
+	price_buckets = [
+		{'key': key, 'label': label, 'count': facet_counts['price'].get(key, 0)}
+		for key, label in facets.price_bucket_choices()
+	]
+	
 	context = {
 		'products': products,
 		'categories': categories,
+		'price_buckets': price_buckets,
+		'sale_count': facet_counts['sale'].get('yes', 0),
+		'in_stock_count': facet_counts['stock'].get('yes', 0),
 		'query': query,
 		'selected_category': category_filter,
 		'selected_sort': sort_by,
-		'total_results': products.count()
+		'selected_price': price_filter,
+		'on_sale': on_sale,
+		'in_stock': in_stock,
+		'total_results': total_results
 	}
 	
 	return render(request, 'search.html', context)
 
+
+def search_cache_stats(request):
+	"""Hit/miss counters of the search result cache, for monitoring"""
+	if not request.user.is_staff:
+		return JsonResponse({'success': False, 'message': 'Unauthorized'}, status=403)
+	return JsonResponse(search_cache.stats())
+
+def search_suggest(request):
+	"""Search-as-you-type for the navbar, answered from the in-process prefix index"""
+	query = request.GET.get('q', '')[:100]
+	try:
+		limit = int(request.GET.get('limit', autocomplete.SUGGEST_LIMIT))
+	except ValueError:
+		limit = autocomplete.SUGGEST_LIMIT
+	
+	suggestions = [
+		{'label': entry['label'], 'type': entry['type'], 'url': entry['url']}
+		for entry in autocomplete.suggest(query, limit)
+	]
+	return JsonResponse({'query': query, 'suggestions': suggestions})
+
 # @login_required Note: this one is for showing social app linked
 # def account_settings(request):
 # 	return render(request, 'account_settings.html', {'user': request.user})